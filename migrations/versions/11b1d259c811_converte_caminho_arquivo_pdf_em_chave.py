@@ -0,0 +1,44 @@
+"""Converte caminho_arquivo_pdf em chave do storage
+
+Revision ID: 11b1d259c811
+Revises: c0206dfc027f
+Create Date: 2026-10-19 15:06:33.918240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '11b1d259c811'
+down_revision = 'c0206dfc027f'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE = 1000
+
+
+def upgrade():
+    # Os registros antigos guardam o caminho absoluto no disco do servidor; a chave é o nome do arquivo
+    with op.get_context().autocommit_block():
+        conexao = op.get_bind()
+        while True:
+            resultado = conexao.execute(sa.text(r"""
+                UPDATE convenio SET caminho_arquivo_pdf = regexp_replace(caminho_arquivo_pdf, '^.*[/\\]', '')
+                WHERE id IN (
+                    SELECT id FROM convenio
+                    WHERE caminho_arquivo_pdf ~ '[/\\]'
+                    LIMIT :lote
+                )
+            """), {'lote': TAMANHO_LOTE})
+            if resultado.rowcount == 0:
+                break
+
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_convenio_caminho_arquivo_pdf'), ['caminho_arquivo_pdf'], unique=False)
+
+
+def downgrade():
+    # As chaves continuam válidas como nomes de arquivo dentro de UPLOAD_FOLDER
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_convenio_caminho_arquivo_pdf'))
@@ -0,0 +1,74 @@
+"""Adiciona diretor_id ao convenio e unidade_uniesp ao usuario
+
+Revision ID: 50d27b5bdcd1
+Revises: ddfc49bd88aa
+Create Date: 2026-10-19 11:27:52.804316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '50d27b5bdcd1'
+down_revision = 'ddfc49bd88aa'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE = 1000
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unidade_uniesp', sa.String(length=255), nullable=True))
+
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('diretor_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('convenio_diretor_id_fkey', 'users', ['diretor_id'], ['id'], ondelete='SET NULL')
+
+    # Associa os convênios existentes aos usuários em lotes: primeiro pelo e-mail, depois pelo nome
+    with op.get_context().autocommit_block():
+        conexao = op.get_bind()
+        ultimo_id = None
+        while True:
+            if ultimo_id is None:
+                ids = conexao.execute(
+                    sa.text("SELECT id FROM convenio ORDER BY id LIMIT :lote"),
+                    {'lote': TAMANHO_LOTE}).scalars().all()
+            else:
+                ids = conexao.execute(
+                    sa.text("SELECT id FROM convenio WHERE id > CAST(:ultimo AS uuid) ORDER BY id LIMIT :lote"),
+                    {'ultimo': ultimo_id, 'lote': TAMANHO_LOTE}).scalars().all()
+            if not ids:
+                break
+            lote = [str(id_) for id_ in ids]
+            conexao.execute(sa.text("""
+                UPDATE convenio c SET diretor_id = u.id
+                FROM users u
+                WHERE c.id = ANY(CAST(:ids AS uuid[]))
+                  AND c.diretor_id IS NULL
+                  AND lower(u.email) = lower(trim(c.diretor_responsavel_email))
+            """), {'ids': lote})
+            conexao.execute(sa.text("""
+                UPDATE convenio c SET diretor_id = u.id
+                FROM users u
+                WHERE c.id = ANY(CAST(:ids AS uuid[]))
+                  AND c.diretor_id IS NULL
+                  AND lower(u.username) = lower(trim(c.diretor_responsavel))
+            """), {'ids': lote})
+            ultimo_id = lote[-1]
+
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.create_index('ix_convenio_diretor_status_assinatura', ['diretor_id', 'status', 'data_assinatura'], unique=False)
+        batch_op.create_index('ix_convenio_unidade_uniesp', ['unidade_uniesp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.drop_index('ix_convenio_unidade_uniesp')
+        batch_op.drop_index('ix_convenio_diretor_status_assinatura')
+        batch_op.drop_constraint('convenio_diretor_id_fkey', type_='foreignkey')
+        batch_op.drop_column('diretor_id')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('unidade_uniesp')
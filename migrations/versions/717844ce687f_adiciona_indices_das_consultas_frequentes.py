@@ -0,0 +1,34 @@
+"""Adiciona indices das consultas frequentes
+
+Revision ID: 717844ce687f
+Revises: 11b1d259c811
+Create Date: 2026-10-19 16:22:05.611473
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '717844ce687f'
+down_revision = '11b1d259c811'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY não bloqueia escritas, mas não pode rodar dentro de uma transação.
+    # Se a migração for interrompida, remova o índice INVALID que sobrar antes de repeti-la.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_audit_log_timestamp', 'audit_log', ['timestamp'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_audit_log_user_id', 'audit_log', ['user_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_users_lower_username', 'users', [sa.text('lower(username)')], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_lower_email', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_lower_username', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_audit_log_user_id', table_name='audit_log', postgresql_concurrently=True)
+        op.drop_index('ix_audit_log_timestamp', table_name='audit_log', postgresql_concurrently=True)
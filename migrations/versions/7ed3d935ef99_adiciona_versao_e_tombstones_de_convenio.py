@@ -0,0 +1,43 @@
+"""Adiciona versao e tombstones de convenio para sincronizacao incremental
+
+Revision ID: 7ed3d935ef99
+Revises: 5f05786aad95
+Create Date: 2026-10-19 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7ed3d935ef99'
+down_revision = '5f05786aad95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # As linhas existentes recebem o txid desta migração, ficando visíveis na primeira sincronização.
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('versao', sa.BigInteger(), server_default=sa.text('txid_current()'), nullable=False))
+        batch_op.create_index(batch_op.f('ix_convenio_versao'), ['versao'], unique=False)
+
+    op.create_table('convenio_removido',
+    sa.Column('convenio_id', sa.UUID(), nullable=False),
+    sa.Column('versao', sa.BigInteger(), server_default=sa.text('txid_current()'), nullable=False),
+    sa.Column('removido_em', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('convenio_id')
+    )
+    with op.batch_alter_table('convenio_removido', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_convenio_removido_versao'), ['versao'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('convenio_removido', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_convenio_removido_versao'))
+
+    op.drop_table('convenio_removido')
+
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_convenio_versao'))
+        batch_op.drop_column('versao')
@@ -0,0 +1,31 @@
+"""Adiciona escopo (diretor e unidade) aos tombstones de convenio
+
+Revision ID: a3c5e81f0d24
+Revises: f1730b7b7742
+Create Date: 2026-10-20 09:41:05.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e81f0d24'
+down_revision = 'f1730b7b7742'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tombstones já existentes ficam sem escopo (unidade_uniesp NULL) e continuam sendo entregues a todos
+    with op.batch_alter_table('convenio_removido', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('diretor_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('unidade_uniesp', sa.String(length=255), nullable=True))
+        batch_op.create_foreign_key('convenio_removido_diretor_id_fkey', 'users', ['diretor_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('convenio_removido', schema=None) as batch_op:
+        batch_op.drop_constraint('convenio_removido_diretor_id_fkey', type_='foreignkey')
+        batch_op.drop_column('unidade_uniesp')
+        batch_op.drop_column('diretor_id')
@@ -0,0 +1,77 @@
+"""Adiciona cnpj_normalizado ao convenio
+
+Revision ID: ddfc49bd88aa
+Revises: 7ed3d935ef99
+Create Date: 2026-10-19 10:03:17.220954
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ddfc49bd88aa'
+down_revision = '7ed3d935ef99'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE = 1000
+
+PESOS_PRIMEIRO_DV = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+PESOS_SEGUNDO_DV = [6] + PESOS_PRIMEIRO_DV
+
+
+def _digito_verificador(digitos, pesos):
+    resto = sum(int(d) * p for d, p in zip(digitos, pesos)) % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def _normalizar(valor):
+    # Cópia da regra de services/cnpj.py, para a migração não depender do código da aplicação.
+    # CNPJs inválidos ficam com NULL e continuam visíveis pelo campo 'cnpj' original.
+    digitos = re.sub(r'\D', '', valor or '')
+    if len(digitos) != 14 or digitos == digitos[0] * 14:
+        return None
+    if digitos[12] != _digito_verificador(digitos[:12], PESOS_PRIMEIRO_DV) or \
+       digitos[13] != _digito_verificador(digitos[:13], PESOS_SEGUNDO_DV):
+        return None
+    return digitos
+
+
+def upgrade():
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cnpj_normalizado', sa.String(length=14), nullable=True))
+
+    # Preenche em lotes, confirmando cada lote, para não manter a tabela inteira bloqueada
+    with op.get_context().autocommit_block():
+        conexao = op.get_bind()
+        ultimo_id = None
+        while True:
+            if ultimo_id is None:
+                linhas = conexao.execute(
+                    sa.text("SELECT id, cnpj FROM convenio ORDER BY id LIMIT :lote"),
+                    {'lote': TAMANHO_LOTE}).fetchall()
+            else:
+                linhas = conexao.execute(
+                    sa.text("SELECT id, cnpj FROM convenio WHERE id > CAST(:ultimo AS uuid) ORDER BY id LIMIT :lote"),
+                    {'ultimo': ultimo_id, 'lote': TAMANHO_LOTE}).fetchall()
+            if not linhas:
+                break
+            atualizacoes = [{'id': str(id_), 'cnpj': _normalizar(cnpj)} for id_, cnpj in linhas]
+            atualizacoes = [a for a in atualizacoes if a['cnpj']]
+            if atualizacoes:
+                conexao.execute(
+                    sa.text("UPDATE convenio SET cnpj_normalizado = :cnpj WHERE id = CAST(:id AS uuid)"),
+                    atualizacoes)
+            ultimo_id = str(linhas[-1][0])
+
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_convenio_cnpj_normalizado'), ['cnpj_normalizado'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('convenio', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_convenio_cnpj_normalizado'))
+        batch_op.drop_column('cnpj_normalizado')
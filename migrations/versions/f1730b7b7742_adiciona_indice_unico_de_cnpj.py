@@ -0,0 +1,41 @@
+"""Adiciona indice unico parcial de cnpj_normalizado
+
+Revision ID: f1730b7b7742
+Revises: 867fc4701345
+Create Date: 2026-10-19 21:12:40.318467
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1730b7b7742'
+down_revision = '867fc4701345'
+branch_labels = None
+depends_on = None
+
+INDICE = 'uq_convenio_cnpj_normalizado'
+
+
+def upgrade():
+    # O índice só existe com CNPJ_UNICO ligado; ao mudar a configuração depois, use 'flask cnpj indice'
+    if not current_app.config['CNPJ_UNICO']:
+        return
+    conexao = op.get_bind()
+    repetido = conexao.execute(sa.text(
+        "SELECT cnpj_normalizado FROM convenio WHERE cnpj_normalizado IS NOT NULL "
+        "GROUP BY cnpj_normalizado HAVING count(*) > 1 LIMIT 1")).scalar()
+    if repetido:
+        # Não interrompe a atualização: o índice é criado por 'flask cnpj indice' depois da limpeza
+        print(f"CNPJ {repetido} (e possivelmente outros) em mais de um convênio: índice {INDICE} não criado.")
+        return
+    with op.get_context().autocommit_block():
+        op.create_index(INDICE, 'convenio', ['cnpj_normalizado'], unique=True,
+                        postgresql_where=sa.text('cnpj_normalizado IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {INDICE}')
@@ -1,6 +1,7 @@
+from flask import current_app
 from flask_wtf import FlaskForm
-from sqlalchemy.dialects.postgresql import UUID, TEXT
-from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import JSONB, UUID, TEXT
+from sqlalchemy import func, or_
 from db import db
 from datetime import datetime
 from enum import Enum as PyEnum
@@ -17,9 +18,20 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256))
     # Perfil do usuário
     role = db.Column(db.String(20), nullable=False, default='diretor')
+    # Unidade do diretor: define quais convênios ele enxerga além dos seus
+    unidade_uniesp = db.Column(db.String(255), nullable=True)
+    # Forma de receber os avisos por e-mail: 'tempo_real' ou 'resumo' (None usa o padrão da aplicação)
+    preferencia_notificacao = db.Column(db.String(20), nullable=True)
+
+    __table_args__ = (
+        # Buscas sem diferenciar maiúsculas de minúsculas (login, associação de diretores, preferências)
+        db.Index('ix_users_lower_username', func.lower(username)),
+        db.Index('ix_users_lower_email', func.lower(email)),
+    )
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Parâmetros do hash configuráveis; hashes antigos são atualizados no próximo login (services/senhas.py)
+        self.password_hash = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -32,10 +44,18 @@ class ConvenioStatus(PyEnum):
 
 class Convenios(db.Model):
     __tablename__ = 'convenio'
+    __table_args__ = (
+        # Atende às consultas dos diretores: seus convênios filtrados por status e data de assinatura
+        db.Index('ix_convenio_diretor_status_assinatura', 'diretor_id', 'status', 'data_assinatura'),
+        db.Index('ix_convenio_unidade_uniesp', 'unidade_uniesp'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=func.uuid_generate_v4())
     nome_conveniada = db.Column(db.String(255), nullable=False)
     cnpj = db.Column(db.String(255), nullable=False)
+    # CNPJ apenas com os 14 dígitos, usado nas buscas e na verificação de duplicidade
+    # (com CNPJ_UNICO, também pelo índice único parcial uq_convenio_cnpj_normalizado, criado fora do modelo)
+    cnpj_normalizado = db.Column(db.String(14), nullable=True, index=True)
     nome_fantasia = db.Column(db.String(255), nullable=False)
     cidade = db.Column(db.String(255), nullable=False)
     estado = db.Column(db.String(255), nullable=False)
@@ -50,12 +70,33 @@ class Convenios(db.Model):
     unidade_uniesp = db.Column(db.String(255), nullable=False)
     diretor_responsavel = db.Column(db.String(255), nullable=False)
     diretor_responsavel_email = db.Column(db.String(255), nullable=True)
+    # Usuário diretor responsável (resolvido a partir do nome/e-mail informados no cadastro)
+    diretor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
     data_assinatura = db.Column(db.Date, nullable=False)
     observacoes = db.Column(TEXT(), nullable=True)
-    caminho_arquivo_pdf = db.Column(db.String(512), nullable=True)
+    # Chave do PDF no storage (independente do backend: diretório local ou bucket S3)
+    caminho_arquivo_pdf = db.Column(db.String(512), nullable=True, index=True)
     status = db.Column(db.Enum(ConvenioStatus), nullable=False)
     criado_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now())
     atualizado_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now(), onupdate=func.now())
+    # ID da transação que gravou a linha por último (txid_current()), usado como cursor da sincronização incremental
+    versao = db.Column(db.BigInteger, nullable=False, default=func.txid_current(), onupdate=func.txid_current(), index=True)
+
+    @staticmethod
+    def filtro_de_escopo(user, diretor_id, unidade_uniesp):
+        # Ponto único da regra de escopo: administradores veem tudo (None = sem filtro);
+        # diretores veem os convênios pelos quais respondem e os da sua unidade
+        if user.role == 'admin':
+            return None
+        filtro = diretor_id == user.id
+        if user.unidade_uniesp:
+            filtro = or_(filtro, unidade_uniesp == user.unidade_uniesp)
+        return filtro
+
+    @classmethod
+    def visiveis_para(cls, user):
+        filtro = cls.filtro_de_escopo(user, cls.diretor_id, cls.unidade_uniesp)
+        return cls.query if filtro is None else cls.query.filter(filtro)
 
     def as_dict(self):
         return {
@@ -76,6 +117,7 @@ class Convenios(db.Model):
             'unidade_uniesp': self.unidade_uniesp,
             'diretor_responsavel': self.diretor_responsavel,
             'diretor_responsavel_email': self.diretor_responsavel_email,
+            'diretor_id': self.diretor_id,
             'data_assinatura': self.data_assinatura.isoformat() if self.data_assinatura else None,
             'observacoes': self.observacoes,
             'caminho_arquivo_pdf': self.caminho_arquivo_pdf,
@@ -83,6 +125,31 @@ class Convenios(db.Model):
             'criado_em': self.criado_em.isoformat(),
             'atualizado_em': self.atualizado_em.isoformat()
         }
+
+# Registro de exclusão ("tombstone") de convênios, consumido pela sincronização incremental
+class ConvenioRemovido(db.Model):
+    __tablename__ = 'convenio_removido'
+
+    convenio_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=func.txid_current(), index=True)
+    removido_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now())
+    # Escopo do convênio no momento da exclusão, para entregar o tombstone só a quem o via
+    # (NULL em unidade_uniesp: tombstone anterior a estas colunas, entregue a todos)
+    diretor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    unidade_uniesp = db.Column(db.String(255), nullable=True)
+
+    @classmethod
+    def visiveis_para(cls, user):
+        filtro = Convenios.filtro_de_escopo(user, cls.diretor_id, cls.unidade_uniesp)
+        if filtro is None:
+            return cls.query
+        return cls.query.filter(or_(filtro, cls.unidade_uniesp.is_(None)))
+
+    def as_dict(self):
+        return {
+            'id': str(self.convenio_id),
+            'removido_em': self.removido_em.isoformat()
+        }
     
 # Modelo de Dados para o Log de Auditoria
 class AuditLog(db.Model):
@@ -90,13 +157,13 @@ class AuditLog(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     # Chave estrangeira e um relacionamento com a tabela de usuários
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     user = db.relationship('User', backref=db.backref('audit_logs', lazy=True))
 
     action = db.Column(db.String(50), nullable=False)     # Ação realizada (ex: 'CREATE', 'UPDATE', 'DELETE')
     record_id = db.Column(db.String(100), nullable=False) # O ID do registro de convênio/usuário que foi alterado
     table_name = db.Column(db.String(255), nullable=False) # O nome da tabela alterada 
-    timestamp = db.Column(db.DateTime(timezone=True), server_default=func.now()) # A data e hora da ação
+    timestamp = db.Column(db.DateTime(timezone=True), server_default=func.now(), index=True) # A data e hora da ação
     details = db.Column(db.String(1024), nullable=True) # Detalhes adicionais sobre a mudança
 
     def as_dict(self):
@@ -109,4 +176,91 @@ class AuditLog(db.Model):
             'table_name': self.table_name,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'details': self.details
-        }
\ No newline at end of file
+        }
+
+# Contagem diária das ações de auditoria, mantida pelo services/auditoria.py a cada gravação em audit_log
+class AuditLogResumo(db.Model):
+    __tablename__ = 'audit_log_resumo'
+
+    dia = db.Column(db.Date, primary_key=True)   # Dia da ação no fuso AUDITORIA_FUSO_HORARIO
+    user_id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(50), primary_key=True)
+    table_name = db.Column(db.String(255), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+# Notificações por e-mail aguardando o envio do resumo diário
+class NotificacaoPendente(db.Model):
+    __tablename__ = 'notificacao_pendente'
+    __table_args__ = (
+        # Só as notificações ainda não enviadas são consultadas pelo envio do resumo
+        db.Index('ix_notificacao_pendente_destinatario', 'destinatario', postgresql_where=db.text('enviado_em IS NULL')),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    destinatario = db.Column(db.String(255), nullable=False)
+    tipo = db.Column(db.String(50), nullable=False)   # Tipo do aviso (ex: 'NOVO_CONVENIO', 'VENCIMENTO')
+    convenio_id = db.Column(UUID(as_uuid=True), nullable=True, index=True)
+    criado_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now())
+    enviado_em = db.Column(db.TIMESTAMP, nullable=True)
+
+# Pares de convênios suspeitos de serem a mesma empresa, gerados por 'flask convenios dedupe'
+class ConvenioDuplicata(db.Model):
+    __tablename__ = 'convenio_duplicata'
+
+    # Sempre convenio_a < convenio_b, para que cada par seja gravado uma única vez
+    convenio_a = db.Column(UUID(as_uuid=True), db.ForeignKey('convenio.id', ondelete='CASCADE'), primary_key=True)
+    convenio_b = db.Column(UUID(as_uuid=True), db.ForeignKey('convenio.id', ondelete='CASCADE'), primary_key=True, index=True)
+    pontuacao = db.Column(db.Float, nullable=False)     # Similaridade do par, de 0 a 1
+    criterio = db.Column(db.String(50), nullable=False)  # O que aproximou o par (ex: 'cnpj', 'cnpj_raiz', 'nome')
+    # Agrupamento (componente conexo dos pares): menor id de convênio do grupo
+    grupo = db.Column(UUID(as_uuid=True), nullable=True, index=True)
+    detectado_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now())
+
+    def as_dict(self):
+        return {
+            'convenio_a': str(self.convenio_a),
+            'convenio_b': str(self.convenio_b),
+            'pontuacao': round(self.pontuacao, 3),
+            'criterio': self.criterio
+        }
+
+# Estado das tarefas em lote incrementais (cursor de onde a próxima execução continua)
+class TarefaEstado(db.Model):
+    __tablename__ = 'tarefa_estado'
+
+    nome = db.Column(db.String(100), primary_key=True)
+    cursor = db.Column(db.BigInteger, nullable=True)
+    executado_em = db.Column(db.TIMESTAMP, nullable=True)
+
+# Relatórios gerados em segundo plano por 'flask relatorios worker'
+class Relatorio(db.Model):
+    __tablename__ = 'relatorio'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)      # 'convenios' ou 'auditoria'
+    formato = db.Column(db.String(10), nullable=False)   # 'csv', 'xlsx' ou 'pdf'
+    parametros = db.Column(JSONB, nullable=False)        # Filtros: unidade_uniesp, data_inicio, data_fim, status
+    # Hash do tipo, formato, parâmetros e versão dos dados: pedidos idênticos reaproveitam o mesmo arquivo
+    chave_cache = db.Column(db.String(64), nullable=False, index=True)
+    # Maior txid em andamento no momento do pedido; o arquivo só vai para o cache se o worker enxergar todas elas
+    txid_solicitacao = db.Column(db.BigInteger, nullable=False)
+    cacheavel = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente', index=True)  # pendente, processando, concluido, erro
+    chave_arquivo = db.Column(db.String(512), nullable=True)  # Chave do arquivo gerado no storage
+    erro = db.Column(TEXT(), nullable=True)
+    solicitado_por = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    criado_em = db.Column(db.TIMESTAMP, nullable=False, default=func.now())
+    iniciado_em = db.Column(db.TIMESTAMP, nullable=True)
+    concluido_em = db.Column(db.TIMESTAMP, nullable=True)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'formato': self.formato,
+            'parametros': self.parametros,
+            'status': self.status,
+            'erro': self.erro,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None
+        }
@@ -1,13 +1,19 @@
 from flask import Blueprint, flash, redirect, render_template, request, jsonify, send_from_directory, url_for
 from flask_login import login_required, current_user
 from db import db
-from models.convenios import AuditLog, Convenios, ConvenioStatus
+from models.convenios import AuditLog, ConvenioDuplicata, Convenios, ConvenioRemovido, ConvenioStatus, User
+from collections import defaultdict
 from datetime import datetime
-import os
-import uuid
-from werkzeug.utils import secure_filename
-from flask_mail import Mail, Message
+from sqlalchemy import func, not_, text
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import joinedload
 from routes.routes_user import role_required
+from services import auditoria
+from services.cnpj import INDICE_CNPJ_UNICO, formatar_cnpj, normalizar_cnpj
+from services.consultas import orcamento_consultas
+from services.limites import tempo_limite_sql
+from services.notificacoes import notificar_novo_convenio
+from services.storage import assinar_chave, chave_assinada, gerar_chave, obter_storage
 
 # BLueprint de Convênios
 convenio_bp = Blueprint('convenio_bp', __name__)
@@ -18,23 +24,71 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Função auxiliar para encontrar o usuário diretor a partir do e-mail (ou, na falta dele, do nome) informado
+def resolver_diretor_id(nome, email):
+    diretor = None
+    if email:
+        diretor = User.query.filter(func.lower(User.email) == email.strip().lower()).first()
+    if diretor is None and nome:
+        diretor = User.query.filter(func.lower(User.username) == nome.strip().lower()).first()
+    return diretor.id if diretor else None
+
+# Função auxiliar para obter a chave do PDF: enviado direto ao storage (campo 'chave_arquivo_pdf', com a
+# chave assinada devolvida pelo presign) ou, como alternativa, recebido junto com o formulário e gravado pela aplicação
+def obter_chave_arquivo(campo_arquivo, assinatura_enviada, convenio_id=None):
+    storage = obter_storage()
+    if assinatura_enviada:
+        # Só vale a chave gerada para este usuário no presign: o cliente não escolhe a chave
+        chave = chave_assinada(assinatura_enviada, current_user.id)
+        if not chave or not storage.existe(chave):
+            raise ValueError('Arquivo enviado não encontrado.')
+        # Um arquivo já associado a outro convênio não pode ser reaproveitado
+        em_uso = Convenios.query.filter(Convenios.caminho_arquivo_pdf == chave)
+        if convenio_id is not None:
+            em_uso = em_uso.filter(Convenios.id != convenio_id)
+        if em_uso.first():
+            raise ValueError('Arquivo já associado a outro convênio.')
+        return chave
+    arquivo = request.files.get(campo_arquivo)
+    if arquivo and allowed_file(arquivo.filename):
+        chave = gerar_chave(arquivo.filename)
+        storage.salvar(chave, arquivo)
+        return chave
+    return None
+
+# Campos que a edição pode alterar diretamente; os demais campos do convênio (id, versao, cnpj_normalizado,
+# diretor_id, caminho_arquivo_pdf, datas de controle) são derivados ou têm fluxo próprio
+CAMPOS_EDITAVEIS = {
+    'nome_conveniada', 'cnpj', 'nome_fantasia', 'cidade', 'estado', 'area_atuacao',
+    'qtd_funcionarios', 'qtd_associados', 'qtd_sindicalizados', 'responsavel_legal', 'cargo_responsavel',
+    'email_responsavel', 'telefone_responsavel', 'unidade_uniesp', 'diretor_responsavel',
+    'diretor_responsavel_email', 'data_assinatura', 'observacoes', 'status',
+}
+
+# Função auxiliar para reconhecer a violação do índice único de CNPJ (gravação simultânea do mesmo CNPJ)
+def cnpj_duplicado(erro):
+    return getattr(getattr(erro.orig, 'diag', None), 'constraint_name', None) == INDICE_CNPJ_UNICO
+
 # --- Rotas de Visualização (Servindo HTML) ---
 
 @convenio_bp.route('/')
 @login_required
 @role_required(['admin', 'diretor'])
+@orcamento_consultas(1)
 def index():
     return render_template('index.html')
 
 @convenio_bp.route('/visualizar')
 @login_required
 @role_required(['admin', 'diretor'])
+@orcamento_consultas(1)
 def visualizar_convenios():
     return render_template('visualizar_convenios.html')
 
 @convenio_bp.route('/visualizar_logs')
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(1)
 def visualizar_logs():
     return render_template('visualizador_logs_auditoria.html')
 
@@ -43,32 +97,105 @@ def visualizar_logs():
 @convenio_bp.route('/convenios_api', methods=['GET'])
 @login_required
 @role_required(['admin', 'diretor'])
+@tempo_limite_sql(15000)
+@orcamento_consultas(2)
 def get_convenios_api():
-    convenios = Convenios.query.all()
+    convenios = Convenios.visiveis_para(current_user).all()
     convenios_list = [convenio.as_dict() for convenio in convenios]
     return jsonify(convenios_list)
 
+# Sincronização incremental: devolve apenas o que mudou desde o cursor informado
+@convenio_bp.route('/convenios/changes', methods=['GET'])
+@login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(5)
+def get_convenios_changes():
+    since = request.args.get('since')
+    if since is not None and not since.isdigit():
+        return jsonify({'error': 'Cursor inválido.'}), 400
+
+    # O novo cursor é o xmin do snapshot atual: toda transação com txid menor já terminou,
+    # então nenhuma linha com versao abaixo dele pode ser confirmada depois desta leitura.
+    # Por isso o cursor é calculado ANTES das consultas de dados.
+    cursor = db.session.execute(text('SELECT txid_snapshot_xmin(txid_current_snapshot())')).scalar()
+
+    if since is None:
+        # Sem cursor: carga completa, sem tombstones
+        convenios = Convenios.visiveis_para(current_user).all()
+        removidos = []
+    else:
+        since = int(since)
+        convenios = Convenios.visiveis_para(current_user).filter(Convenios.versao >= since).all()
+        # Tombstones pelo escopo gravado na exclusão: cada diretor só recebe as exclusões do que via
+        removidos = [removido.as_dict() for removido in
+                     ConvenioRemovido.visiveis_para(current_user).filter(ConvenioRemovido.versao >= since)]
+        filtro = Convenios.filtro_de_escopo(current_user, Convenios.diretor_id, Convenios.unidade_uniesp)
+        if filtro is not None:
+            # Alterados que não são mais visíveis (mudaram de diretor ou de unidade) saem do cliente como removidos
+            fora_do_escopo = db.session.query(Convenios.id, Convenios.atualizado_em) \
+                .filter(Convenios.versao >= since, not_(func.coalesce(filtro, False))).all()
+            removidos += [{'id': str(convenio_id), 'removido_em': atualizado_em.isoformat()}
+                          for convenio_id, atualizado_em in fora_do_escopo]
+
+    return jsonify({
+        'convenios': [convenio.as_dict() for convenio in convenios],
+        'removidos': removidos,
+        'cursor': str(cursor)
+    })
+
+# Grupos de possíveis convênios duplicados, para revisão pelos administradores
+@convenio_bp.route('/convenios/duplicatas', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@tempo_limite_sql(15000)
+@orcamento_consultas(4)
+def get_convenios_duplicatas():
+    # Grupos de possíveis duplicatas gravados por 'flask convenios dedupe', dos mais prováveis aos menos
+    limite = request.args.get('limite', 100, type=int)
+    maior_pontuacao = func.max(ConvenioDuplicata.pontuacao).label('maior_pontuacao')
+    grupos = db.session.query(ConvenioDuplicata.grupo, maior_pontuacao) \
+        .group_by(ConvenioDuplicata.grupo) \
+        .order_by(maior_pontuacao.desc(), ConvenioDuplicata.grupo) \
+        .limit(limite).all()
+    if not grupos:
+        return jsonify([])
+
+    pares = ConvenioDuplicata.query.filter(ConvenioDuplicata.grupo.in_([grupo for grupo, _ in grupos])) \
+        .order_by(ConvenioDuplicata.pontuacao.desc()).all()
+    ids = {par.convenio_a for par in pares} | {par.convenio_b for par in pares}
+    convenios = {convenio.id: convenio for convenio in Convenios.query.filter(Convenios.id.in_(ids))}
+
+    pares_por_grupo = defaultdict(list)
+    for par in pares:
+        pares_por_grupo[par.grupo].append(par)
+
+    resultado = []
+    for grupo, pontuacao in grupos:
+        membros = sorted({par.convenio_a for par in pares_por_grupo[grupo]} | {par.convenio_b for par in pares_por_grupo[grupo]})
+        resultado.append({
+            'grupo': str(grupo),
+            'pontuacao': round(pontuacao, 3),
+            'convenios': [{
+                'id': str(convenios[convenio_id].id),
+                'nome_conveniada': convenios[convenio_id].nome_conveniada,
+                'nome_fantasia': convenios[convenio_id].nome_fantasia,
+                'cnpj': convenios[convenio_id].cnpj,
+                'cidade': convenios[convenio_id].cidade,
+                'unidade_uniesp': convenios[convenio_id].unidade_uniesp,
+                'status': convenios[convenio_id].status.value
+            } for convenio_id in membros],
+            'pares': [par.as_dict() for par in pares_por_grupo[grupo]]
+        })
+    return jsonify(resultado)
+
 # Cadastrar Convênio
 @convenio_bp.route('/convenio', methods=['POST'])
 @login_required
 @role_required(['admin', 'diretor'])
+@orcamento_consultas(12)
 def adicionar_convenio():
-    from app import app, mail
+    from app import app
 
-    # Função auxiliar para enviar e-mail
-    def send_email(to_email, subject, body):
-        try:
-            with app.app_context():
-                msg = Message(subject,
-                            sender=app.config['MAIL_USERNAME'],
-                            recipients=[to_email])
-                msg.body = body
-                mail.send(msg)
-                print(f"E-mail enviado com sucesso para {to_email}.")
-                return True
-        except Exception as e:
-            print(f"Erro ao enviar e-mail: {e}")
-            return False
     try:
         # Obtém os dados de texto do formulário (request.form)
         nome_conveniada = request.form.get('nome_conveniada')
@@ -94,19 +221,26 @@ def adicionar_convenio():
         # Converte tipos
         data_assinatura = datetime.strptime(data_assinatura_str, '%Y-%m-%d').date() if data_assinatura_str else None
         status = ConvenioStatus(status_str) if status_str in [e.value for e in ConvenioStatus] else None
+
+        # Normaliza e valida o CNPJ
+        try:
+            cnpj_normalizado = normalizar_cnpj(cnpj)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if app.config['CNPJ_UNICO'] and Convenios.query.filter_by(cnpj_normalizado=cnpj_normalizado).first():
+            return jsonify({'error': 'Já existe um convênio cadastrado com este CNPJ.'}), 409
         
-        # Prepara o arquivo
-        arquivo = request.files.get('caminho_arquivo_pdf')
-        caminho_arquivo = None
-        if arquivo and allowed_file(arquivo.filename):
-            nome_seguro = secure_filename(arquivo.filename)
-            nome_arquivo_unico = str(uuid.uuid4()) + "_" + nome_seguro
-            caminho_arquivo = os.path.join(app.config['UPLOAD_FOLDER'], nome_arquivo_unico)
+        # Prepara o arquivo (já enviado direto ao storage ou recebido no formulário)
+        try:
+            caminho_arquivo = obter_chave_arquivo('caminho_arquivo_pdf', request.form.get('chave_arquivo_pdf'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Cria o novo objeto Convenios
         novoConvenio = Convenios(
             nome_conveniada=nome_conveniada,
-            cnpj=cnpj,
+            cnpj=formatar_cnpj(cnpj_normalizado),
+            cnpj_normalizado=cnpj_normalizado,
             nome_fantasia=nome_fantasia,
             cidade=cidade,
             estado=estado,
@@ -121,6 +255,7 @@ def adicionar_convenio():
             unidade_uniesp=unidade_uniesp,
             diretor_responsavel=diretor_responsavel,
             diretor_responsavel_email=diretor_responsavel_email,
+            diretor_id=resolver_diretor_id(diretor_responsavel, diretor_responsavel_email),
             data_assinatura=data_assinatura,
             observacoes=observacoes,
             caminho_arquivo_pdf=caminho_arquivo,
@@ -128,22 +263,17 @@ def adicionar_convenio():
         )
         
         db.session.add(novoConvenio)
-        db.session.commit()
-
-        # --- Lógica de Envio de E-mail ---
-        if diretor_responsavel_email:
-            assunto = f"Nova Parceria Cadastrada - {nome_conveniada}"
-            corpo = f"""Prezado(a) Diretor(a),\n\n
-Informamos que a unidade {unidade_uniesp} firmou nova parceria com a empresa {nome_conveniada},
-com benefícios educacionais válidos a partir de {data_assinatura.strftime('%d/%m/%Y')}.
-
-Termo anexado: [https://uniespvestibular.com.br/convenios/]
-
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            # A verificação acima não impede duas gravações simultâneas; o índice único sim
+            db.session.rollback()
+            if not cnpj_duplicado(e):
+                raise
+            return jsonify({'error': 'Já existe um convênio cadastrado com este CNPJ.'}), 409
 
-Atenciosamente,
-Equipe UNIESP"""
-            send_email(diretor_responsavel_email, assunto, corpo)
-        # --- Fim da Lógica de E-mail ---
+        # --- Notificação do diretor (imediata ou no resumo diário, conforme a preferência) ---
+        notificar_novo_convenio(novoConvenio)
 
         # --- LOG DE AUDITORIA: Ação de Criação ---
         log_entry = AuditLog(
@@ -156,14 +286,15 @@ Equipe UNIESP"""
         db.session.add(log_entry)
         db.session.commit()
         # --- FIM DO LOG DE AUDITORIA ---
-
-        if arquivo and caminho_arquivo:
-            arquivo.save(caminho_arquivo)
         
         # Redireciona o usuário para a página de visualização após o sucesso
         flash('Convênio inserido com sucesso!')
         return redirect(url_for('convenio_bp.visualizar_convenios'))
 
+    except (OperationalError, PoolTimeoutError):
+        # Tempo limite do SQL e pool esgotado viram 503 com Retry-After (services/limites.py)
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -172,14 +303,40 @@ Equipe UNIESP"""
 @convenio_bp.route('/convenio/<uuid:convenio_id>', methods=['GET'])
 @login_required
 @role_required(['admin', 'diretor'])
+@orcamento_consultas(2)
 def get_convenio(convenio_id):
-    convenio = Convenios.query.get_or_404(convenio_id)
+    convenio = Convenios.visiveis_para(current_user).filter_by(id=convenio_id).first_or_404()
     return jsonify(convenio.as_dict())
 
+# Buscar Convênios pelo CNPJ (usado pelo formulário para avisar sobre duplicidade)
+@convenio_bp.route('/convenios/by-cnpj/<path:cnpj>', methods=['GET'])
+@login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(2)
+def get_convenios_by_cnpj(cnpj):
+    try:
+        cnpj_normalizado = normalizar_cnpj(cnpj)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # A verificação de duplicidade é institucional (não usa o escopo do diretor) e devolve só dados de identificação
+    convenios = Convenios.query.filter_by(cnpj_normalizado=cnpj_normalizado).all()
+    return jsonify({
+        'cnpj': formatar_cnpj(cnpj_normalizado),
+        'convenios': [{
+            'id': str(convenio.id),
+            'nome_conveniada': convenio.nome_conveniada,
+            'nome_fantasia': convenio.nome_fantasia,
+            'unidade_uniesp': convenio.unidade_uniesp,
+            'status': convenio.status.value
+        } for convenio in convenios]
+    })
+
 # Editar Convênio (por id)
 @convenio_bp.route('/convenio/<uuid:convenio_id>', methods=['PATCH', 'POST'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(12)
 def update_convenio(convenio_id):
     convenio = Convenios.query.get_or_404(convenio_id)
     from app import app # Acesso ao config do app
@@ -191,9 +348,16 @@ def update_convenio(convenio_id):
             data = request.form
 
         print(f"DEBUG: Dados recebidos para atualização do Convênio {convenio_id}: {data}") # Log de debug
+
+        # Campos protegidos do modelo são recusados; chaves auxiliares do formulário (ex.: convenio_id) são ignoradas
+        protegidos = sorted(set(data) & set(Convenios.__table__.columns.keys()) - CAMPOS_EDITAVEIS)
+        if protegidos:
+            return jsonify({'error': f"Campos não editáveis: {', '.join(protegidos)}."}), 400
         
         # Itera sobre os dados recebidos para atualizar o convênio
         for key, value in data.items():
+            if key not in CAMPOS_EDITAVEIS:
+                continue
 
             # Garante que None (ou seja, campos vazios) não causem erros de string
             if value is None or value == '':
@@ -221,6 +385,21 @@ def update_convenio(convenio_id):
                 else:
                     print("DEBUG STATUS: Valor do status recebido está vazio ou nulo. Nenhuma alteração de status.")
 
+            elif key == 'cnpj':
+                if value:
+                    try:
+                        cnpj_normalizado = normalizar_cnpj(value)
+                    except ValueError as e:
+                        db.session.rollback()
+                        return jsonify({'error': str(e)}), 400
+                    duplicado = Convenios.query.filter(Convenios.cnpj_normalizado == cnpj_normalizado,
+                                                       Convenios.id != convenio.id).first()
+                    if app.config['CNPJ_UNICO'] and duplicado:
+                        db.session.rollback()
+                        return jsonify({'error': 'Já existe um convênio cadastrado com este CNPJ.'}), 409
+                    convenio.cnpj = formatar_cnpj(cnpj_normalizado)
+                    convenio.cnpj_normalizado = cnpj_normalizado
+
             elif key in ['qtd_funcionarios', 'qtd_associados', 'qtd_sindicalizados']:
                 if value is not None:
                     setattr(convenio, key, int(value))
@@ -228,23 +407,32 @@ def update_convenio(convenio_id):
             # Atualiza todos os outros campos de texto/string
             elif value is not None:
                 setattr(convenio, key, value)
+
+        # Reassocia o diretor se o nome ou o e-mail do responsável foram alterados
+        if 'diretor_responsavel' in data or 'diretor_responsavel_email' in data:
+            convenio.diretor_id = resolver_diretor_id(convenio.diretor_responsavel, convenio.diretor_responsavel_email)
         
         # Verifica se um novo arquivo foi enviado para substituição
-        if 'documento' in request.files:
-            arquivo = request.files['documento']
-            if arquivo and allowed_file(arquivo.filename):
-                # Apaga o arquivo antigo se ele existir
-                if convenio.caminho_arquivo_pdf and os.path.exists(convenio.caminho_arquivo_pdf):
-                    os.remove(convenio.caminho_arquivo_pdf)
-
-                # Salva o novo arquivo
-                nome_seguro = secure_filename(arquivo.filename)
-                nome_arquivo_unico = str(uuid.uuid4()) + "_" + nome_seguro
-                caminho_salvo = os.path.join(app.config['UPLOAD_FOLDER'], nome_arquivo_unico)
-                arquivo.save(caminho_salvo)
-                setattr(convenio, 'caminho_arquivo_pdf', caminho_salvo)
+        arquivo_antigo = convenio.caminho_arquivo_pdf
+        try:
+            nova_chave = obter_chave_arquivo('documento', data.get('chave_arquivo_pdf'), convenio.id)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        if nova_chave:
+            convenio.caminho_arquivo_pdf = nova_chave
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if not cnpj_duplicado(e):
+                raise
+            return jsonify({'error': 'Já existe um convênio cadastrado com este CNPJ.'}), 409
+
+        # O arquivo antigo só é apagado depois que o banco confirmou a troca
+        if nova_chave and arquivo_antigo:
+            obter_storage().remover(arquivo_antigo)
 
         # --- LOG DE AUDITORIA: Ação de Atualização ---
         log_entry = AuditLog(
@@ -261,6 +449,10 @@ def update_convenio(convenio_id):
         flash('Convênio atualizado com sucesso!', 'success')
         return jsonify({'message': 'Convênio atualizado com sucesso'})
 
+    except (OperationalError, PoolTimeoutError):
+        # Tempo limite do SQL e pool esgotado viram 503 com Retry-After (services/limites.py)
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -269,10 +461,10 @@ def update_convenio(convenio_id):
 @convenio_bp.route('/convenio/<uuid:convenio_id>', methods=['DELETE'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(10)
 def delete(convenio_id):
     convenio = Convenios.query.get_or_404(convenio_id)
-    
-    from app import app
+    arquivo = convenio.caminho_arquivo_pdf
 
     # --- LOG DE AUDITORIA: Ação de Exclusão ---
     log_entry = AuditLog(
@@ -283,30 +475,120 @@ def delete(convenio_id):
         details=f"Convênio '{convenio.nome_conveniada}' excluído."
     )
     db.session.add(log_entry)
-    db.session.commit()
     # --- FIM DO LOG DE AUDITORIA ---
 
-    # Apaga o arquivo associado antes de excluir o registro do banco
-    if convenio.caminho_arquivo_pdf and os.path.exists(convenio.caminho_arquivo_pdf):
-        os.remove(convenio.caminho_arquivo_pdf)
-
     db.session.delete(convenio)
+    # Auditoria, exclusão e tombstone confirmados juntos; o id vem da rota, pois o objeto
+    # excluído não pode mais ser lido depois do commit
+    db.session.add(ConvenioRemovido(convenio_id=convenio_id, diretor_id=convenio.diretor_id,
+                                    unidade_uniesp=convenio.unidade_uniesp))
     db.session.commit()
+
+    # Apaga o arquivo associado só depois que a exclusão foi confirmada no banco
+    if arquivo:
+        obter_storage().remover(arquivo)
     flash('Convênio removido com sucesso!', 'success')
     return jsonify({'message': 'Convênio removido com sucesso'})
 
 # Rota para servir o PDF
 @convenio_bp.route('/uploads/<path:filename>')
 @login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(2)
 def download_file(filename):
     from app import app
+    # Só libera arquivos de convênios visíveis para o usuário
+    Convenios.visiveis_para(current_user).filter_by(caminho_arquivo_pdf=filename).first_or_404()
+
+    # Com storage externo o navegador baixa direto de lá, por uma URL de curta duração
+    url = obter_storage().url_download(filename)
+    if url:
+        return redirect(url)
     # Retorna o arquivo solicitado do diretório de uploads
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+# Rota para preparar o envio de um PDF direto ao storage (URL pré-assinada)
+@convenio_bp.route('/uploads/presign', methods=['POST'])
+@login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(1)
+def presign_upload():
+    nome_arquivo = (request.get_json(silent=True) or {}).get('nome_arquivo')
+    if not nome_arquivo or not allowed_file(nome_arquivo):
+        return jsonify({'error': 'Apenas arquivos PDF são permitidos.'}), 400
+
+    chave = gerar_chave(nome_arquivo)
+    upload = obter_storage().url_upload(chave)
+    return jsonify({'chave': chave, 'chave_assinada': assinar_chave(chave, current_user.id),
+                    'url': upload['url'], 'fields': upload['fields']})
+
+# Destino do upload pré-assinado quando o storage é local (UPLOAD_FOLDER)
+@convenio_bp.route('/uploads/direto', methods=['POST'])
+@login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(1)
+def upload_direto():
+    storage = obter_storage()
+    chave = storage.validar_token(request.form.get('token', '')) if hasattr(storage, 'validar_token') else None
+    arquivo = request.files.get('file')
+    if not chave or not arquivo:
+        return jsonify({'error': 'Envio de arquivo inválido ou expirado.'}), 400
+
+    storage.salvar(chave, arquivo)
+    return '', 204
+
 # Rota para visualizar os Logs de Auditoria
 @convenio_bp.route('/logs_auditoria', methods=['GET'])
 @login_required
 @role_required(['admin'])
+@tempo_limite_sql(15000)
+@orcamento_consultas(2)
 def get_logs_auditoria():
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).all()
-    return jsonify([log.as_dict() for log in logs])
\ No newline at end of file
+    # Carrega os usuários na mesma consulta: as_dict() usa log.user.username em cada linha
+    logs = AuditLog.query.options(joinedload(AuditLog.user)).order_by(AuditLog.timestamp.desc()).all()
+    return jsonify([log.as_dict() for log in logs])
+
+# Contagem das ações por período (dia/semana), usuário, ação e tabela, servida pelo resumo de auditoria
+@convenio_bp.route('/logs_auditoria/analitico', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(2)
+def get_logs_auditoria_analitico():
+    agrupamento = request.args.get('agrupar', 'dia')
+    dimensoes = [d for d in request.args.get('dimensoes', ','.join(auditoria.DIMENSOES)).split(',') if d]
+    if agrupamento not in auditoria.AGRUPAMENTOS:
+        return jsonify({'error': f"Agrupamento inválido. Use: {', '.join(auditoria.AGRUPAMENTOS)}."}), 400
+    if any(d not in auditoria.DIMENSOES for d in dimensoes):
+        return jsonify({'error': f"Dimensão inválida. Use: {', '.join(auditoria.DIMENSOES)}."}), 400
+    try:
+        inicio, fim = auditoria.periodo_dos_parametros(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'agrupamento': agrupamento,
+        'atividade': auditoria.atividade(inicio, fim, agrupamento, dimensoes)
+    })
+
+# Detalhamento: os registros por trás de uma contagem, em páginas (cursor 'antes_de' = id do último registro recebido)
+@convenio_bp.route('/logs_auditoria/registros', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(2)
+def get_logs_auditoria_registros():
+    try:
+        inicio, fim = auditoria.periodo_dos_parametros(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filtros = {}
+    if request.args.get('user_id'):
+        filtros['user_id'] = request.args.get('user_id', type=int)
+    for campo in ('action', 'table_name'):
+        if request.args.get(campo):
+            filtros[campo] = request.args[campo]
+    limite = max(1, min(request.args.get('limite', 50, type=int), auditoria.LIMITE_REGISTROS))
+
+    registros, proximo = auditoria.registros(inicio, fim, filtros, request.args.get('antes_de', type=int), limite)
+    return jsonify({'registros': [log.as_dict() for log in registros], 'proximo': proximo})
@@ -0,0 +1,71 @@
+import json
+import queue
+from flask import Blueprint, Response, jsonify, request
+from flask_login import login_required, current_user
+from routes.routes_user import role_required
+from services.consultas import orcamento_consultas
+from services.eventos import broker, filtro_para, iniciar_ouvinte
+
+# Blueprint do feed de alterações em tempo real (Server-Sent Events)
+eventos_bp = Blueprint('eventos_bp', __name__)
+
+# Intervalo (em segundos) entre heartbeats, para manter a conexão aberta em proxies
+INTERVALO_HEARTBEAT = 15
+
+def formatar_evento(evento):
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+# Cada conexão aberta ocupa uma thread do worker enquanto durar: a aplicação precisa rodar com workers
+# com threads ou assíncronos (ex.: gunicorn -k gthread --threads N, ou -k gevent), e EVENTOS_MAXIMO_CONEXOES
+# deve ficar abaixo do número de threads por processo para sobrar capacidade para as demais rotas
+@eventos_bp.route('/eventos')
+@login_required
+@role_required(['admin', 'diretor'])
+@orcamento_consultas(1)
+def stream_eventos():
+    from app import app
+    iniciar_ouvinte(app)
+
+    # Convênios pelo mesmo escopo das consultas (visiveis_para); auditoria só para administradores
+    visivel = filtro_para(current_user)
+    ultimo_id = request.headers.get('Last-Event-ID')
+
+    # Assina antes de consultar o buffer para não perder eventos entre as duas etapas
+    fila = broker.assinar(visivel, app.config['EVENTOS_MAXIMO_CONEXOES'])
+    if fila is None:
+        return jsonify({'error': 'Muitas conexões abertas. Tente novamente em instantes.'}), 503, \
+            {'Retry-After': str(app.config['RETRY_AFTER_SEGUNDOS'])}
+
+    def gerar():
+        try:
+            yield 'retry: 3000\n\n'
+            reenviados = set()
+            if ultimo_id:
+                perdidos = broker.eventos_desde(ultimo_id)
+                if perdidos is None:
+                    # O evento já saiu do buffer: o cliente precisa recarregar a lista completa
+                    yield 'event: reset\ndata: {}\n\n'
+                else:
+                    for evento in perdidos:
+                        reenviados.add(evento['id'])
+                        if visivel(evento):
+                            yield formatar_evento(evento)
+            while True:
+                try:
+                    evento = fila.get(timeout=INTERVALO_HEARTBEAT)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                if evento is None:
+                    return
+                if evento['id'] in reenviados:
+                    continue
+                yield formatar_evento(evento)
+        finally:
+            broker.cancelar(fila)
+
+    resposta = Response(gerar(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Libera a vaga mesmo se o cliente desconectar antes de o gerador começar (o finally não rodaria)
+    resposta.call_on_close(lambda: broker.cancelar(fila))
+    return resposta
@@ -0,0 +1,37 @@
+import re
+from flask import Blueprint, abort, jsonify, render_template, send_from_directory
+from flask_login import login_required
+from routes.routes_user import role_required
+from services.consultas import orcamento_consultas
+from services.perfil import listar_perfis
+
+# Blueprint dos perfis de execução das requisições (somente administradores)
+perfil_bp = Blueprint('perfil_bp', __name__)
+
+# Nomes gerados por services/perfil.py: <data>_<método>_<endpoint>.<folded|json>
+PADRAO_ARQUIVO = re.compile(r'^[\w.-]+\.(folded|json)$')
+
+@perfil_bp.route('/perfis')
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(1)
+def visualizar_perfis():
+    return render_template('visualizar_perfis.html')
+
+@perfil_bp.route('/perfis_api', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(1)
+def get_perfis_api():
+    from app import app
+    return jsonify(listar_perfis(app.config['PERFIL_DIRETORIO']))
+
+@perfil_bp.route('/perfis/<nome_arquivo>')
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(1)
+def download_perfil(nome_arquivo):
+    from app import app
+    if not PADRAO_ARQUIVO.match(nome_arquivo):
+        abort(404)
+    return send_from_directory(app.config['PERFIL_DIRETORIO'], nome_arquivo, as_attachment=True)
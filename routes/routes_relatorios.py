@@ -0,0 +1,65 @@
+from flask import Blueprint, jsonify, redirect, render_template, request, send_from_directory
+from flask_login import login_required, current_user
+from models.convenios import ConvenioStatus, Relatorio
+from routes.routes_user import role_required
+from services.consultas import orcamento_consultas
+from services.relatorios import TIPOS, formatos_disponiveis, solicitar_relatorio, validar_parametros
+from services.storage import obter_storage
+
+# Blueprint dos relatórios gerados em segundo plano (somente administradores)
+relatorios_bp = Blueprint('relatorios_bp', __name__)
+
+@relatorios_bp.route('/relatorios')
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(1)
+def visualizar_relatorios():
+    return render_template('visualizar_relatorios.html', tipos=TIPOS, formatos=formatos_disponiveis(),
+                           status=[s.value for s in ConvenioStatus])
+
+@relatorios_bp.route('/relatorios', methods=['POST'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(7)
+def solicitar():
+    # A geração fica a cargo do worker (flask relatorios worker); aqui só entra o pedido na fila
+    try:
+        tipo, formato, parametros = validar_parametros(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    relatorio, criado = solicitar_relatorio(tipo, formato, parametros, current_user)
+    return jsonify(relatorio.as_dict()), 202 if criado else 200
+
+@relatorios_bp.route('/relatorios_api', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(2)
+def get_relatorios_api():
+    relatorios = Relatorio.query.order_by(Relatorio.id.desc()).limit(50).all()
+    return jsonify([relatorio.as_dict() for relatorio in relatorios])
+
+# Consultada periodicamente pela página até o relatório ficar pronto
+@relatorios_bp.route('/relatorios/<int:relatorio_id>', methods=['GET'])
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(2)
+def get_relatorio(relatorio_id):
+    relatorio = Relatorio.query.get_or_404(relatorio_id)
+    return jsonify(relatorio.as_dict())
+
+@relatorios_bp.route('/relatorios/<int:relatorio_id>/download')
+@login_required
+@role_required(['admin'])
+@orcamento_consultas(2)
+def download_relatorio(relatorio_id):
+    from app import app
+    relatorio = Relatorio.query.get_or_404(relatorio_id)
+    if relatorio.status != 'concluido':
+        return jsonify({'error': 'Relatório ainda não está pronto.'}), 409
+
+    url = obter_storage().url_download(relatorio.chave_arquivo)
+    if url:
+        return redirect(url)
+    return send_from_directory(app.config['UPLOAD_FOLDER'], relatorio.chave_arquivo, as_attachment=True,
+                               download_name=f"relatorio_{relatorio.tipo}_{relatorio.id}.{relatorio.formato}")
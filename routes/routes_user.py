@@ -1,9 +1,12 @@
 from functools import wraps
 from flask import Blueprint, flash, redirect, render_template, request, jsonify, url_for
 from flask_login import login_user, logout_user, login_required, current_user
-from sqlalchemy import or_
+from sqlalchemy import func, or_
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from db import db
 from models.convenios import User, AuditLog
+from services.consultas import orcamento_consultas
+from services.senhas import VerificacaoSaturada, obter_verificador, precisa_rehash
 
 # 1. Criação do Blueprint: O prefixo de URL aqui será vazio ('/') ou '/usuarios' se quisermos isolar.
 user_bp = Blueprint('user_bp', __name__)
@@ -26,6 +29,7 @@ def role_required(roles):
 # --- Rotas de Login e Logout ---
 
 @user_bp.route('/login', methods=['GET', 'POST'])
+@orcamento_consultas(3)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('convenio_bp.visualizar_convenios'))
@@ -35,10 +39,33 @@ def login():
         email_input = request.form.get('email')
         password = request.form.get('password')
 
-        # A busca continua flexível, procurando o valor fornecido (email_input) tanto no campo 'username' quanto no campo 'email'.
-        user = User.query.filter(or_(User.username == email_input, User.email == email_input)).first()
+        # A busca continua flexível, procurando o valor fornecido (email_input) tanto no campo 'username' quanto no campo 'email',
+        # sem diferenciar maiúsculas de minúsculas (atendida pelos índices em lower(username) e lower(email))
+        identificador = (email_input or '').strip()
+        candidatos = User.query.filter(or_(func.lower(User.username) == identificador.lower(),
+                                           func.lower(User.email) == identificador.lower())).order_by(User.id).limit(10).all()
+        # Usuários antigos podem diferir só nas maiúsculas ('Admin' e 'admin'): vale então a grafia exata,
+        # e sem ela o login é recusado em vez de escolher um deles
+        if len(candidatos) > 1:
+            candidatos = [c for c in candidatos if identificador in (c.username, c.email)]
+        user = candidatos[0] if len(candidatos) == 1 else None
 
-        if user and user.check_password(password):
+        verificador = obter_verificador()
+        try:
+            senha_correta = bool(user and user.password_hash and verificador.verificar(user.password_hash, password))
+        except VerificacaoSaturada:
+            from app import app
+            flash("Muitos acessos no momento. Tente novamente em instantes.")
+            return render_template('login.html'), 503, {'Retry-After': str(app.config['RETRY_AFTER_SEGUNDOS'])}
+        if senha_correta and precisa_rehash(user.password_hash):
+            try:
+                user.password_hash = verificador.gerar_hash(password)
+                db.session.commit()
+            except VerificacaoSaturada:
+                # A senha já foi conferida: sem vaga para refazer o hash, ele fica para o próximo login
+                pass
+
+        if senha_correta:
             login_user(user)
             return redirect(url_for('convenio_bp.visualizar_convenios'))
         else:
@@ -49,6 +76,7 @@ def login():
 
 @user_bp.route('/logout')
 @login_required
+@orcamento_consultas(1)
 def logout():
     logout_user()
     return redirect(url_for('user_bp.login'))
@@ -58,18 +86,24 @@ def logout():
 @user_bp.route('/register', methods=['GET', 'POST'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(5)
 def register():
     if request.method == 'POST':
         email = request.form.get('email')
         username = request.form.get('username')
         password = request.form.get('password')
         role = request.form.get('role')
+        unidade_uniesp = request.form.get('unidade_uniesp') or None
 
-        if User.query.filter_by(email=email).first():
+        # Comparação sem maiúsculas/minúsculas, como no login
+        if User.query.filter(func.lower(User.email) == (email or '').strip().lower()).first():
             flash("Endereço de e-mail já registrado.")
             return redirect(url_for('user_bp.register'))
+        if User.query.filter(func.lower(User.username) == (username or '').strip().lower()).first():
+            flash("Nome de usuário já registrado.")
+            return redirect(url_for('user_bp.register'))
         
-        new_user = User(email=email, username=username, role=role)
+        new_user = User(email=email, username=username, role=role, unidade_uniesp=unidade_uniesp)
         new_user.set_password(password)
         db.session.add(new_user)
         db.session.commit()
@@ -82,6 +116,7 @@ def register():
 @user_bp.route('/visualizar_usuarios')
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(1)
 def visualizar_usuarios():
     return render_template('visualizar_usuarios.html')
 
@@ -89,6 +124,7 @@ def visualizar_usuarios():
 @user_bp.route('/users_api', methods=['GET'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(2)
 def get_users_api():
     users = User.query.all()
     # Retorna uma lista de dicionários com os dados dos usuários
@@ -96,22 +132,28 @@ def get_users_api():
         'id': user.id,
         'username': user.username,
         'email': user.email,
-        'role': user.role
+        'role': user.role,
+        'unidade_uniesp': user.unidade_uniesp,
+        'preferencia_notificacao': user.preferencia_notificacao
     } for user in users])
 
 # --- Rota para editar um usuário ---
 @user_bp.route('/users/<int:user_id>', methods=['PATCH'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(9)
 def update_user_api(user_id):
     user = User.query.get_or_404(user_id)
     data = request.json
     
     try:
-        # Verifica se o email já existe para outro usuário
-        if 'email' in data and data['email'] != user.email:
-            if User.query.filter_by(email=data['email']).first():
+        # Verifica se o email já existe para outro usuário, sem diferenciar maiúsculas (índice em lower(email))
+        if data.get('email'):
+            if User.query.filter(func.lower(User.email) == data['email'].strip().lower(), User.id != user.id).first():
                 return jsonify({'error': 'Este e-mail já está em uso.'}), 400
+        if data.get('username'):
+            if User.query.filter(func.lower(User.username) == data['username'].strip().lower(), User.id != user.id).first():
+                return jsonify({'error': 'Este nome de usuário já está em uso.'}), 400
             
         if 'username' in data:
             user.username = data['username']
@@ -119,6 +161,12 @@ def update_user_api(user_id):
             user.email = data['email']
         if 'role' in data:
             user.role = data['role']
+        if 'unidade_uniesp' in data:
+            user.unidade_uniesp = data['unidade_uniesp'] or None
+        if 'preferencia_notificacao' in data:
+            if data['preferencia_notificacao'] not in (None, 'tempo_real', 'resumo'):
+                return jsonify({'error': 'Preferência de notificação inválida.'}), 400
+            user.preferencia_notificacao = data['preferencia_notificacao']
         if 'password' in data and data['password']:
             user.set_password(data['password'])
         
@@ -136,6 +184,10 @@ def update_user_api(user_id):
         db.session.commit()
         
         return jsonify({'message': 'Usuário atualizado com sucesso!'})
+    except (OperationalError, PoolTimeoutError):
+        # Tempo limite do SQL e pool esgotado viram 503 com Retry-After (services/limites.py)
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -144,6 +196,7 @@ def update_user_api(user_id):
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(8)
 def delete_user_api(user_id):
     user = User.query.get_or_404(user_id)
     
@@ -163,6 +216,10 @@ def delete_user_api(user_id):
         db.session.commit()
         
         return jsonify({'message': 'Usuário removido com sucesso!'})
+    except (OperationalError, PoolTimeoutError):
+        # Tempo limite do SQL e pool esgotado viram 503 com Retry-After (services/limites.py)
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -170,6 +227,7 @@ def delete_user_api(user_id):
 @user_bp.route('/users/diretores_api', methods=['GET'])
 @login_required
 @role_required(['admin'])
+@orcamento_consultas(2)
 def get_diretores_api():
     diretores = User.query.filter_by(role='diretor').all()
     return jsonify([{'id': diretor.id, 'username': diretor.username} for diretor in diretores])
\ No newline at end of file
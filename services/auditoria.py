@@ -0,0 +1,140 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Date, cast, delete, event, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload
+
+from db import db
+from models.convenios import AuditLog, AuditLogResumo, User
+
+AGRUPAMENTOS = ('dia', 'semana')
+DIMENSOES = ('user_id', 'action', 'table_name')
+PERIODO_PADRAO_DIAS = 30
+LIMITE_REGISTROS = 200
+
+
+def _fuso():
+    return current_app.config['AUDITORIA_FUSO_HORARIO']
+
+
+def _inicio_do_dia(dia):
+    # Meia-noite do dia no fuso da auditoria, como timestamptz (compara direto com audit_log.timestamp)
+    return func.timezone(_fuso(), datetime.combine(dia, time.min))
+
+
+def _atualizar_resumo(session, flush_context):
+    novos = Counter((obj.user_id, obj.action, obj.table_name) for obj in session.new if isinstance(obj, AuditLog))
+    if not novos:
+        return
+    conexao = session.connection()
+    if conexao.dialect.name != 'postgresql':
+        return
+    # now() é o início da transação, o mesmo instante gravado em audit_log.timestamp pelo server_default
+    dia = cast(func.timezone(_fuso(), func.now()), Date)
+    tabela = AuditLogResumo.__table__
+    # Linhas em ordem fixa: duas transações concorrentes travam as mesmas linhas na mesma sequência
+    upsert = pg_insert(tabela).values([
+        {'dia': dia, 'user_id': user_id, 'action': action, 'table_name': table_name, 'total': total}
+        for (user_id, action, table_name), total in sorted(novos.items())
+    ])
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[tabela.c.dia, tabela.c.user_id, tabela.c.action, tabela.c.table_name],
+        set_={'total': tabela.c.total + upsert.excluded.total})
+    conexao.execute(upsert)
+
+
+def preencher_resumo(desde=None):
+    """Recalcula o resumo a partir de audit_log (todo o histórico ou a partir de 'desde'), na transação corrente."""
+    dia = cast(func.timezone(_fuso(), AuditLog.timestamp), Date)
+    apagar = delete(AuditLogResumo)
+    consulta = select(dia, AuditLog.user_id, AuditLog.action, AuditLog.table_name, func.count()) \
+        .where(AuditLog.timestamp.isnot(None)) \
+        .group_by(dia, AuditLog.user_id, AuditLog.action, AuditLog.table_name)
+    if desde:
+        apagar = apagar.where(AuditLogResumo.dia >= desde)
+        consulta = consulta.where(AuditLog.timestamp >= _inicio_do_dia(desde))
+    db.session.execute(apagar)
+    db.session.execute(insert(AuditLogResumo).from_select(
+        ['dia', 'user_id', 'action', 'table_name', 'total'], consulta))
+
+
+def reconstruir_resumo(desde=None):
+    # O bloqueio espera as transações que já atualizaram o resumo terminarem e segura as novas até o
+    # commit, para que nenhuma gravação seja contada duas vezes ou perdida durante a reconstrução
+    db.session.execute(text('LOCK TABLE audit_log_resumo IN SHARE ROW EXCLUSIVE MODE'))
+    preencher_resumo(desde)
+    db.session.commit()
+
+
+def periodo_dos_parametros(args):
+    """(início, fim) a partir de ?inicio=&fim= (AAAA-MM-DD); padrão: últimos 30 dias. Levanta ValueError."""
+    try:
+        fim = date.fromisoformat(args['fim']) if args.get('fim') else date.today()
+        inicio = date.fromisoformat(args['inicio']) if args.get('inicio') else fim - timedelta(days=PERIODO_PADRAO_DIAS)
+    except ValueError:
+        raise ValueError('Datas inválidas (use AAAA-MM-DD).')
+    if inicio > fim:
+        raise ValueError('A data inicial é posterior à data final.')
+    return inicio, fim
+
+
+def atividade(inicio, fim, agrupamento, dimensoes):
+    """Total de ações por período (dia ou semana) e pelas dimensões pedidas, lido só do resumo."""
+    if agrupamento == 'semana':
+        periodo = cast(func.date_trunc('week', AuditLogResumo.dia), Date)
+    else:
+        periodo = AuditLogResumo.dia
+    colunas = [periodo] + [getattr(AuditLogResumo, dimensao) for dimensao in dimensoes]
+    if 'user_id' in dimensoes:
+        colunas.append(User.username)
+    query = db.session.query(*colunas, func.sum(AuditLogResumo.total)).select_from(AuditLogResumo)
+    if 'user_id' in dimensoes:
+        query = query.outerjoin(User, User.id == AuditLogResumo.user_id)
+    linhas = query.filter(AuditLogResumo.dia.between(inicio, fim)) \
+        .group_by(*colunas) \
+        .order_by(*colunas).all()
+
+    nomes = ['periodo'] + list(dimensoes) + (['username'] if 'user_id' in dimensoes else []) + ['total']
+    resultado = [dict(zip(nomes, linha)) for linha in linhas]
+    for item in resultado:
+        item['periodo'] = item['periodo'].isoformat()
+    return resultado
+
+
+def registros(inicio, fim, filtros, antes_de=None, limite=50):
+    """Linhas de audit_log do período, das mais novas para as mais antigas, paginadas pelo id (keyset).
+
+    Retorna (registros, próximo cursor ou None). O cursor é passado de volta em 'antes_de'.
+    """
+    query = AuditLog.query.options(joinedload(AuditLog.user)).filter(
+        AuditLog.timestamp >= _inicio_do_dia(inicio),
+        AuditLog.timestamp < _inicio_do_dia(fim + timedelta(days=1)))
+    for campo, valor in filtros.items():
+        query = query.filter(getattr(AuditLog, campo) == valor)
+    if antes_de is not None:
+        query = query.filter(AuditLog.id < antes_de)
+    # Um a mais que o limite indica se há próxima página, sem COUNT
+    linhas = query.order_by(AuditLog.id.desc()).limit(limite + 1).all()
+    proximo = linhas[limite - 1].id if len(linhas) > limite else None
+    return linhas[:limite], proximo
+
+
+def init_app(app):
+    event.listen(Session, 'after_flush', _atualizar_resumo)
+
+
+# --- Comandos de linha (flask auditoria ...) ---
+auditoria_cli = AppGroup('auditoria', help='Manutenção dos dados de auditoria.')
+
+
+@auditoria_cli.command('reconstruir-resumo')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Recalcula só a partir deste dia (AAAA-MM-DD); sem ela, todo o histórico.')
+def reconstruir_resumo_command(desde):
+    """Recalcula audit_log_resumo a partir de audit_log (após a migração ou mudança de fuso horário)."""
+    reconstruir_resumo(desde.date() if desde else None)
+    click.echo('Resumo da auditoria reconstruído.')
@@ -0,0 +1,81 @@
+import re
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from db import db
+
+# Índice único parcial que garante CNPJ_UNICO no banco (duas gravações simultâneas não passam ambas)
+INDICE_CNPJ_UNICO = 'uq_convenio_cnpj_normalizado'
+
+# Pesos do cálculo dos dígitos verificadores do CNPJ (módulo 11)
+PESOS_PRIMEIRO_DV = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+PESOS_SEGUNDO_DV = [6] + PESOS_PRIMEIRO_DV
+
+
+def _digito_verificador(digitos, pesos):
+    resto = sum(int(d) * p for d, p in zip(digitos, pesos)) % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def normalizar_cnpj(valor):
+    """Retorna o CNPJ com 14 dígitos, sem pontuação. Levanta ValueError se for inválido."""
+    digitos = re.sub(r'\D', '', valor or '')
+    if len(digitos) != 14 or digitos == digitos[0] * 14:
+        raise ValueError('CNPJ inválido: deve conter 14 dígitos.')
+    if digitos[12] != _digito_verificador(digitos[:12], PESOS_PRIMEIRO_DV) or \
+       digitos[13] != _digito_verificador(digitos[:13], PESOS_SEGUNDO_DV):
+        raise ValueError('CNPJ inválido: dígitos verificadores não conferem.')
+    return digitos
+
+
+def formatar_cnpj(digitos):
+    # 12345678000195 -> 12.345.678/0001-95
+    return f"{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}"
+
+
+def cnpjs_repetidos(limite=10):
+    """CNPJs (normalizados) cadastrados em mais de um convênio, que impedem a criação do índice único."""
+    return db.session.execute(text(
+        "SELECT cnpj_normalizado, count(*) FROM convenio WHERE cnpj_normalizado IS NOT NULL "
+        "GROUP BY cnpj_normalizado HAVING count(*) > 1 ORDER BY count(*) DESC LIMIT :limite"),
+        {'limite': limite}).all()
+
+
+def ajustar_indice_cnpj(unico):
+    """Cria (unico=True) ou remove o índice único de CNPJ sem bloquear as gravações. Retorna o que foi feito."""
+    # CREATE/DROP INDEX CONCURRENTLY não podem rodar dentro de uma transação
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        valido = conexao.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :nome"),
+            {'nome': INDICE_CNPJ_UNICO}).scalar()
+        if unico and valido:
+            return 'mantido'
+        # Um CREATE CONCURRENTLY interrompido deixa o índice inválido: é removido e criado de novo
+        if valido is not None:
+            conexao.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDICE_CNPJ_UNICO}'))
+        if not unico:
+            return 'ausente' if valido is None else 'removido'
+        conexao.execute(text(f'CREATE UNIQUE INDEX CONCURRENTLY {INDICE_CNPJ_UNICO} ON convenio (cnpj_normalizado) '
+                             'WHERE cnpj_normalizado IS NOT NULL'))
+        return 'criado'
+
+
+# --- Comandos de linha (flask cnpj ...) ---
+cnpj_cli = AppGroup('cnpj', help='Manutenção do índice único de CNPJ.')
+
+
+@cnpj_cli.command('indice')
+def indice_cnpj_command():
+    """Cria ou remove o índice único de CNPJ conforme CNPJ_UNICO (rode após mudar a configuração)."""
+    unico = current_app.config['CNPJ_UNICO']
+    repetidos = cnpjs_repetidos() if unico else []
+    if repetidos:
+        for cnpj, total in repetidos:
+            click.echo(f"CNPJ {cnpj} em {total} convênios", err=True)
+        click.echo("Resolva os CNPJs repetidos (veja /convenios/duplicatas) antes de criar o índice único.", err=True)
+        sys.exit(1)
+    click.echo(f"Índice {INDICE_CNPJ_UNICO}: {ajustar_indice_cnpj(unico)}.")
@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+import traceback
+from collections import Counter, defaultdict
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+# Raiz do projeto: só frames do nosso código contam como "local da chamada"
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RE_LISTA_PARAMETROS = re.compile(r'\(\s*%\([^)]+\)s(?:\s*,\s*%\([^)]+\)s)*\s*\)')
+_RE_NUMEROS = re.compile(r'\b\d+\b')
+_RE_ESPACOS = re.compile(r'\s+')
+# Ajustes da sessão (ex.: SET LOCAL statement_timeout) não são consultas da rota
+_RE_CONFIGURACAO = re.compile(r'^\s*SET\s', re.IGNORECASE)
+
+
+def impressao_digital(instrucao):
+    # Duas execuções da "mesma" consulta com valores diferentes geram a mesma impressão digital
+    instrucao = _RE_LISTA_PARAMETROS.sub('(?)', instrucao)
+    instrucao = _RE_NUMEROS.sub('?', instrucao)
+    return _RE_ESPACOS.sub(' ', instrucao).strip()
+
+
+def local_da_chamada():
+    # Frame mais interno do código do projeto (fora deste módulo e das dependências instaladas)
+    for frame in reversed(traceback.extract_stack()):
+        arquivo = os.path.abspath(frame.filename)
+        if arquivo.startswith(RAIZ_PROJETO) and arquivo != os.path.abspath(__file__) \
+                and 'site-packages' not in arquivo:
+            return f"{os.path.relpath(arquivo, RAIZ_PROJETO)}:{frame.lineno} ({frame.name})"
+    return 'desconhecido'
+
+
+class ContadorConsultas:
+    """Conta as instruções SQL executadas pela thread atual enquanto o contexto estiver ativo.
+
+    Uso em testes:
+        with ContadorConsultas(db.engine) as contador:
+            client.get('/convenios_api')
+        contador.verificar(orcamento=2)
+    """
+
+    def __init__(self, engine, guardar_sql=False):
+        self.engine = engine
+        self.instrucoes = []
+        # Com guardar_sql, também a instrução e os parâmetros exatos (usados no EXPLAIN de 'flask planos verificar')
+        self.guardar_sql = guardar_sql
+        self.execucoes = []
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._registrar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._registrar)
+        return False
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread and not _RE_CONFIGURACAO.match(statement):
+            self.instrucoes.append((impressao_digital(statement), local_da_chamada()))
+            if self.guardar_sql and not executemany:
+                self.execucoes.append((statement, parameters))
+
+    @property
+    def total(self):
+        return len(self.instrucoes)
+
+    def repetidas(self, limite=2):
+        """Instruções idênticas executadas mais de 'limite' vezes (suspeitas de N+1), com os locais de chamada.
+
+        O limite padrão tolera a recarga do usuário logado após um commit, que é esperada.
+        """
+        contagem = Counter(digital for digital, _ in self.instrucoes)
+        locais = defaultdict(set)
+        for digital, local in self.instrucoes:
+            locais[digital].add(local)
+        return [(digital, vezes, sorted(locais[digital])) for digital, vezes in contagem.items() if vezes > limite]
+
+    def problemas(self, orcamento=None):
+        problemas = []
+        if orcamento is not None and self.total > orcamento:
+            problemas.append(f"{self.total} consultas, acima do orçamento de {orcamento}")
+        for digital, vezes, locais in self.repetidas():
+            problemas.append(f"possível N+1: {vezes}x em {', '.join(locais)}: {digital[:200]}")
+        return problemas
+
+    def verificar(self, orcamento=None):
+        problemas = self.problemas(orcamento)
+        if problemas:
+            raise AssertionError('\n'.join(problemas))
+
+
+def orcamento_consultas(maximo):
+    """Declara quantas instruções SQL a rota pode executar por requisição.
+
+    Deve ser o decorador mais interno (logo acima do 'def'), para que os demais o copiem via @wraps.
+    """
+    def decorator(f):
+        f.orcamento_consultas = maximo
+        return f
+    return decorator
+
+
+def _iniciar_contagem():
+    from db import db
+    g.contador_consultas = ContadorConsultas(db.engine).__enter__()
+
+
+def _encerrar_contagem(response):
+    contador = g.pop('contador_consultas', None)
+    if contador is None:
+        return response
+    contador.__exit__(None, None, None)
+
+    view = current_app.view_functions.get(request.endpoint)
+    orcamento = getattr(view, 'orcamento_consultas', None)
+    response.headers['X-Consultas-SQL'] = str(contador.total)
+    problemas = contador.problemas(orcamento)
+    for problema in problemas:
+        current_app.logger.warning(f"[consultas] {request.method} {request.path}: {problema}")
+    if problemas and current_app.config['VERIFICAR_CONSULTAS_ESTRITO']:
+        raise AssertionError(f"{request.method} {request.path}: " + '; '.join(problemas))
+    return response
+
+
+def _descartar_contagem(exc):
+    # Garante a remoção do listener quando a rota termina com exceção (sem passar pelo after_request)
+    contador = g.pop('contador_consultas', None)
+    if contador is not None:
+        contador.__exit__(None, None, None)
+
+
+def init_app(app):
+    # Sem VERIFICAR_CONSULTAS nenhum gancho é registrado, então não há custo em produção
+    if not app.config['VERIFICAR_CONSULTAS']:
+        return
+    app.before_request(_iniciar_contagem)
+    app.after_request(_encerrar_contagem)
+    app.teardown_request(_descartar_contagem)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class Disjuntor:
+    """Circuit breaker: depois de 'limite_falhas' falhas seguidas, recusa as chamadas por 'tempo_aberto' segundos.
+
+    Passado esse tempo deixa uma única chamada de teste passar (meio aberto): se ela funcionar o disjuntor
+    fecha; se falhar, volta a abrir. Uso:
+
+        if not disjuntor.permite():
+            ...  # falha rápida: adia em vez de esperar um serviço que está fora
+        try:
+            chamar_servico()
+        except ErroDoServico:
+            disjuntor.registrar_falha()
+        except Exception:
+            disjuntor.liberar_teste()
+            raise
+        else:
+            disjuntor.registrar_sucesso()
+    """
+
+    def __init__(self, nome, limite_falhas, tempo_aberto):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = None
+        self._testando = False
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._aberto_ate is None:
+                return 'fechado'
+            if time.monotonic() < self._aberto_ate:
+                return 'aberto'
+            return 'meio_aberto'
+
+    def permite(self):
+        with self._lock:
+            if self._aberto_ate is None:
+                return True
+            if time.monotonic() < self._aberto_ate or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._aberto_ate = None
+            self._testando = False
+
+    def liberar_teste(self):
+        # Erro que não diz nada sobre o serviço (ex.: mensagem inválida): não conta como falha nem como
+        # sucesso, mas a chamada de teste do estado meio aberto precisa ser liberada para a próxima
+        with self._lock:
+            self._testando = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            # No estado meio aberto basta uma falha para reabrir
+            if self._falhas >= self.limite_falhas or self._aberto_ate is not None:
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
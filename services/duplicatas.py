@@ -0,0 +1,174 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+from difflib import SequenceMatcher
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, or_, text, update
+
+from db import db
+from models.convenios import ConvenioDuplicata, Convenios, TarefaEstado
+from services.uploads import em_lotes
+
+NOME_TAREFA = 'convenios_dedupe'
+LIMIAR_PADRAO = 0.85
+# Blocos maiores que isto (trigramas comuns como "com", "ser") não distinguem nada e são ignorados
+TAMANHO_MAXIMO_BLOCO = 200
+# Trigramas de nome (na mesma cidade) que dois convênios precisam compartilhar para serem comparados
+TRIGRAMAS_EM_COMUM = 3
+# Palavras que não ajudam a distinguir empresas (natureza jurídica, preposições)
+PALAVRAS_IGNORADAS = {'ltda', 'me', 'epp', 'eireli', 'sa', 's', 'a', 'cia', 'e', 'de', 'da', 'do', 'das', 'dos'}
+
+Registro = namedtuple('Registro', 'id nomes cnpj cidade')
+
+
+def normalizar_texto(valor):
+    # Sem acentos, minúsculo e só com letras, dígitos e espaços simples
+    valor = unicodedata.normalize('NFKD', valor or '').encode('ascii', 'ignore').decode().lower()
+    return re.sub(r'[^a-z0-9]+', ' ', valor).strip()
+
+
+def normalizar_nome(nome):
+    return ' '.join(p for p in normalizar_texto(nome).split() if p not in PALAVRAS_IGNORADAS)
+
+
+def trigramas(nome):
+    compacto = nome.replace(' ', '')
+    return {compacto[i:i + 3] for i in range(len(compacto) - 2)}
+
+
+def chaves_de_bloqueio(registro):
+    # Só convênios que compartilham alguma chave são comparados entre si
+    chaves = set()
+    if registro.cnpj:
+        chaves.add(('cnpj', registro.cnpj[:8]))   # Raiz do CNPJ: a mesma empresa em qualquer filial
+    for nome in registro.nomes:
+        for trigrama in trigramas(nome):
+            chaves.add(('trigrama', registro.cidade, trigrama))
+    return chaves
+
+
+def pontuar(a, b):
+    """Retorna (pontuação de 0 a 1, critério) de um par de convênios."""
+    if a.cnpj and a.cnpj == b.cnpj:
+        return 1.0, 'cnpj'
+    nome = max((SequenceMatcher(None, x, y).ratio() for x in a.nomes for y in b.nomes), default=0.0)
+    if a.cnpj and b.cnpj and a.cnpj[:8] == b.cnpj[:8]:
+        return max(nome, 0.9), 'cnpj_raiz'
+    return nome, 'nome'
+
+
+def carregar_registros(desde):
+    """Lê os campos comparados de todos os convênios. Retorna os registros e os ids alterados desde o cursor."""
+    registros = {}
+    alterados = []
+    query = db.session.query(Convenios.id, Convenios.nome_conveniada, Convenios.nome_fantasia,
+                             Convenios.cnpj_normalizado, Convenios.cidade, Convenios.versao).yield_per(2000)
+    for convenio_id, nome_conveniada, nome_fantasia, cnpj, cidade, versao in query:
+        nomes = {n for n in (normalizar_nome(nome_conveniada), normalizar_nome(nome_fantasia)) if n}
+        registros[convenio_id] = Registro(convenio_id, nomes, cnpj, normalizar_texto(cidade))
+        if desde is None or versao >= desde:
+            alterados.append(convenio_id)
+    return registros, alterados
+
+
+def pares_candidatos(registros, alterados):
+    """Pares (menor id, maior id) a comparar: ao menos um lado alterado e chaves de bloqueio em comum."""
+    blocos = defaultdict(list)
+    for registro in registros.values():
+        for chave in chaves_de_bloqueio(registro):
+            blocos[chave].append(registro.id)
+
+    pares = set()
+    for convenio_id in alterados:
+        contagem = Counter()
+        for chave in chaves_de_bloqueio(registros[convenio_id]):
+            membros = blocos[chave]
+            if len(membros) > TAMANHO_MAXIMO_BLOCO:
+                continue
+            # A raiz do CNPJ em comum basta sozinha; trigramas precisam se acumular
+            peso = TRIGRAMAS_EM_COMUM if chave[0] == 'cnpj' else 1
+            for outro in membros:
+                if outro != convenio_id:
+                    contagem[outro] += peso
+        for outro, total in contagem.items():
+            if total >= TRIGRAMAS_EM_COMUM:
+                pares.add((min(convenio_id, outro), max(convenio_id, outro)))
+    return pares
+
+
+def agrupar(pares):
+    # Union-find: cada convênio aponta para o menor id do seu grupo
+    pai = {}
+
+    def raiz(x):
+        pai.setdefault(x, x)
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    for a, b in pares:
+        raiz_a, raiz_b = raiz(a), raiz(b)
+        if raiz_a != raiz_b:
+            pai[max(raiz_a, raiz_b)] = min(raiz_a, raiz_b)
+    return {x: raiz(x) for x in pai}
+
+
+def recalcular_grupos():
+    pares = db.session.query(ConvenioDuplicata.convenio_a, ConvenioDuplicata.convenio_b,
+                             ConvenioDuplicata.grupo).all()
+    grupos = agrupar((a, b) for a, b, _ in pares)
+    mudancas = [{'convenio_a': a, 'convenio_b': b, 'grupo': grupos[a]}
+                for a, b, grupo in pares if grupo != grupos[a]]
+    if mudancas:
+        db.session.execute(update(ConvenioDuplicata), mudancas)
+
+
+def detectar_duplicatas(limiar=LIMIAR_PADRAO, completo=False):
+    """Compara os convênios novos ou alterados desde a última execução e grava os pares suspeitos.
+
+    Retorna (convênios comparados, pares gravados).
+    """
+    estado = db.session.get(TarefaEstado, NOME_TAREFA) or TarefaEstado(nome=NOME_TAREFA)
+    # Cursor obtido antes da leitura: o que for gravado durante a execução entra na próxima
+    novo_cursor = db.session.execute(text('SELECT txid_snapshot_xmin(txid_current_snapshot())')).scalar()
+    registros, alterados = carregar_registros(None if completo else estado.cursor)
+
+    # Os pares dos convênios alterados são refeitos do zero (os excluídos saem pelo ON DELETE CASCADE)
+    if completo:
+        db.session.execute(delete(ConvenioDuplicata))
+    else:
+        for lote in em_lotes(alterados, 1000):
+            db.session.execute(delete(ConvenioDuplicata).where(
+                or_(ConvenioDuplicata.convenio_a.in_(lote), ConvenioDuplicata.convenio_b.in_(lote))))
+
+    novos = []
+    for a, b in pares_candidatos(registros, alterados):
+        pontuacao, criterio = pontuar(registros[a], registros[b])
+        if pontuacao >= limiar:
+            novos.append({'convenio_a': a, 'convenio_b': b, 'pontuacao': pontuacao, 'criterio': criterio})
+    for lote in em_lotes(novos, 1000):
+        db.session.execute(insert(ConvenioDuplicata), lote)
+
+    recalcular_grupos()
+    estado.cursor = novo_cursor
+    estado.executado_em = datetime.now()
+    db.session.add(estado)
+    db.session.commit()
+    return len(alterados), len(novos)
+
+
+# --- Comandos de linha (flask convenios ...) ---
+convenios_cli = AppGroup('convenios', help='Tarefas em lote sobre os convênios.')
+
+
+@convenios_cli.command('dedupe')
+@click.option('--completo', is_flag=True, help='Compara todos os convênios, ignorando o cursor da última execução.')
+@click.option('--limiar', default=LIMIAR_PADRAO, show_default=True, help='Pontuação mínima (0 a 1) para gravar um par.')
+def dedupe_command(completo, limiar):
+    """Detecta convênios possivelmente duplicados e grava os grupos para revisão em /convenios/duplicatas."""
+    comparados, pares = detectar_duplicatas(limiar, completo)
+    click.echo(f"{comparados} convênio(s) comparado(s); {pares} par(es) suspeito(s) gravado(s).")
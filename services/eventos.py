@@ -0,0 +1,209 @@
+import json
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, select as sa_select
+from sqlalchemy.orm import Session
+
+from db import db
+from models.convenios import AuditLog, Convenios
+
+# Canal do PostgreSQL LISTEN/NOTIFY usado para distribuir os eventos entre processos
+CANAL = 'convenios_eventos'
+# Quantidade de eventos mantidos em memória para retomar conexões pelo Last-Event-ID
+TAMANHO_BUFFER = 1000
+# Limite de eventos pendentes por cliente; clientes lentos demais são desconectados
+TAMANHO_FILA_CLIENTE = 256
+
+
+class Broker:
+    """Distribui os eventos recebidos para os clientes SSE conectados a este processo, conforme o filtro de cada um."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = {}
+        self._buffer = deque(maxlen=TAMANHO_BUFFER)
+
+    def assinar(self, filtro, maximo):
+        # Cada cliente prende uma thread do worker: acima de 'maximo' conexões a assinatura é recusada (None)
+        fila = queue.Queue(maxsize=TAMANHO_FILA_CLIENTE)
+        with self._lock:
+            if len(self._assinantes) >= maximo:
+                return None
+            self._assinantes[fila] = filtro
+        return fila
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._assinantes.pop(fila, None)
+
+    def publicar(self, evento):
+        with self._lock:
+            self._buffer.append(evento)
+            assinantes = list(self._assinantes.items())
+        for fila, filtro in assinantes:
+            # O filtro é aplicado antes de enfileirar: o cliente nunca recebe o que não pode ver
+            if not filtro(evento):
+                continue
+            try:
+                fila.put_nowait(evento)
+            except queue.Full:
+                # Cliente não está consumindo: remove e deixa o navegador reconectar
+                self.cancelar(fila)
+                try:
+                    fila.get_nowait()
+                except queue.Empty:
+                    pass
+                fila.put_nowait(None)
+
+    def eventos_desde(self, ultimo_id):
+        # Retorna os eventos posteriores a 'ultimo_id', ou None se ele já saiu do buffer
+        with self._lock:
+            eventos = list(self._buffer)
+        for posicao, evento in enumerate(eventos):
+            if evento['id'] == ultimo_id:
+                return eventos[posicao + 1:]
+        return None
+
+
+broker = Broker()
+
+
+def filtro_para(usuario):
+    """Mesma regra de Convenios.visiveis_para, aplicada aos eventos; auditoria só para administradores."""
+    # Só valores simples: o filtro roda na thread do ouvinte, fora da sessão do usuário
+    admin, user_id, unidade = usuario.role == 'admin', usuario.id, usuario.unidade_uniesp
+
+    def visivel(evento):
+        if admin:
+            return evento['tipo'] in ('convenio', 'auditoria')
+        if evento['tipo'] != 'convenio':
+            return False
+        escopo = evento['dados'].get('escopo', {})
+        return user_id in escopo.get('diretores', []) or (unidade is not None and unidade in escopo.get('unidades', []))
+    return visivel
+
+_ouvinte_lock = threading.Lock()
+_ouvinte = None
+
+
+def usa_postgres(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+
+
+def iniciar_ouvinte(app):
+    # Um único ouvinte LISTEN por processo, criado sob demanda (e recriado após fork)
+    global _ouvinte
+    if not usa_postgres(app):
+        return
+    with _ouvinte_lock:
+        if _ouvinte is not None and _ouvinte.is_alive():
+            return
+        _ouvinte = threading.Thread(target=_escutar, args=(app,), name='eventos-listen', daemon=True)
+        _ouvinte.start()
+
+
+def _escutar(app):
+    while True:
+        conexao = None
+        try:
+            with app.app_context():
+                # Conexão dedicada, retirada do pool para não ocupar uma vaga permanentemente
+                conexao = db.engine.raw_connection()
+                conexao.detach()
+            pg = conexao.driver_connection
+            pg.autocommit = True
+            pg.cursor().execute(f'LISTEN {CANAL}')
+            while True:
+                if select.select([pg], [], [], 5) == ([], [], []):
+                    continue
+                pg.poll()
+                while pg.notifies:
+                    notificacao = pg.notifies.pop(0)
+                    broker.publicar(json.loads(notificacao.payload))
+        except Exception as e:
+            print(f"Erro no ouvinte de eventos, reconectando: {e}")
+            time.sleep(2)
+        finally:
+            if conexao is not None:
+                try:
+                    conexao.close()
+                except Exception:
+                    pass
+
+
+def _novo_evento(tipo, acao, dados):
+    return {'id': uuid.uuid4().hex, 'tipo': tipo, 'acao': acao, 'dados': dados}
+
+
+def _escopo(obj):
+    # Valores atuais e anteriores: quem deixou de ver o convênio numa alteração também recebe o evento
+    estado = inspect(obj)
+    escopo = {}
+    for campo, chave in (('diretor_id', 'diretores'), ('unidade_uniesp', 'unidades')):
+        historico = estado.attrs[campo].history
+        escopo[chave] = sorted({valor for valor in historico.sum() if valor is not None})
+    return escopo
+
+
+def _dados_convenio(obj):
+    return {'id': str(obj.id), 'escopo': _escopo(obj)}
+
+
+def _pendentes(session):
+    return session.info.setdefault('eventos_pendentes', [])
+
+
+def _coletar_eventos(session, flush_context):
+    # Traduz as alterações do flush em eventos; o envio só acontece no commit
+    pendentes = _pendentes(session)
+    for obj in session.new:
+        if isinstance(obj, Convenios):
+            pendentes.append(_novo_evento('convenio', 'CREATE', _dados_convenio(obj)))
+        elif isinstance(obj, AuditLog):
+            pendentes.append(_novo_evento('auditoria', 'CREATE', {
+                'id': obj.id,
+                'user_id': obj.user_id,
+                'username': obj.user.username if obj.user else None,
+                'action': obj.action,
+                'record_id': str(obj.record_id),
+                'table_name': obj.table_name,
+                'details': obj.details
+            }))
+    for obj in session.dirty:
+        if isinstance(obj, Convenios) and session.is_modified(obj):
+            pendentes.append(_novo_evento('convenio', 'UPDATE', _dados_convenio(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Convenios):
+            pendentes.append(_novo_evento('convenio', 'DELETE', _dados_convenio(obj)))
+
+
+def _notificar(session):
+    # No PostgreSQL o NOTIFY entra na própria transação e só é entregue se ela for confirmada
+    if not usa_postgres(current_app):
+        return
+    session.flush()
+    for evento in session.info.pop('eventos_pendentes', []):
+        session.execute(sa_select(func.pg_notify(CANAL, json.dumps(evento))))
+
+
+def _publicar_local(session):
+    # Sem PostgreSQL (execução local) os eventos vão direto para o broker em memória
+    for evento in session.info.pop('eventos_pendentes', []):
+        broker.publicar(evento)
+
+
+def _descartar(session):
+    session.info.pop('eventos_pendentes', None)
+
+
+def init_app(app):
+    event.listen(Session, 'after_flush', _coletar_eventos)
+    event.listen(Session, 'before_commit', _notificar)
+    event.listen(Session, 'after_commit', _publicar_local)
+    event.listen(Session, 'after_soft_rollback', lambda session, transaction: _descartar(session))
@@ -0,0 +1,54 @@
+from flask import current_app, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+# SQLSTATE do PostgreSQL para instrução cancelada (statement_timeout)
+QUERY_CANCELED = '57014'
+
+
+def tempo_limite_sql(milissegundos):
+    """Declara o statement_timeout das consultas da rota, no lugar de SQL_TEMPO_LIMITE_PADRAO_MS.
+
+    Assim como @orcamento_consultas, deve ficar entre os decoradores mais internos.
+    """
+    def decorator(f):
+        f.tempo_limite_sql = milissegundos
+        return f
+    return decorator
+
+
+def _aplicar_tempo_limite(session, transaction, connection):
+    # Só nas requisições web: comandos de linha e o worker de relatórios podem demorar o quanto precisarem
+    if not has_request_context() or connection.dialect.name != 'postgresql':
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    milissegundos = getattr(view, 'tempo_limite_sql', current_app.config['SQL_TEMPO_LIMITE_PADRAO_MS'])
+    # SET LOCAL vale até o fim da transação; a conexão volta ao pool sem o ajuste
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(milissegundos)}")
+
+
+def _servico_indisponivel(mensagem):
+    resposta = jsonify({'error': mensagem})
+    resposta.status_code = 503
+    resposta.headers['Retry-After'] = str(current_app.config['RETRY_AFTER_SEGUNDOS'])
+    return resposta
+
+
+def _pool_esgotado(e):
+    # Nenhuma conexão livre dentro do pool_timeout: responde logo em vez de enfileirar mais requisições
+    current_app.logger.warning(f"[limites] pool de conexões esgotado em {request.method} {request.path}")
+    return _servico_indisponivel('Servidor sobrecarregado. Tente novamente em instantes.')
+
+
+def _erro_operacional(e):
+    if getattr(e.orig, 'pgcode', None) != QUERY_CANCELED:
+        raise e
+    current_app.logger.warning(f"[limites] statement_timeout em {request.method} {request.path}")
+    return _servico_indisponivel('A consulta demorou demais. Tente novamente em instantes.')
+
+
+def init_app(app):
+    event.listen(Session, 'after_begin', _aplicar_tempo_limite)
+    app.register_error_handler(PoolTimeoutError, _pool_esgotado)
+    app.register_error_handler(OperationalError, _erro_operacional)
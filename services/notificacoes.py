@@ -0,0 +1,223 @@
+import smtplib
+import socketserver
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app, render_template
+from flask.cli import AppGroup
+from flask_mail import Connection, Message
+from sqlalchemy import func
+
+from db import db
+from models.convenios import Convenios, ConvenioStatus, NotificacaoPendente, User
+from services.disjuntor import Disjuntor
+
+MODOS_NOTIFICACAO = ('tempo_real', 'resumo')
+
+
+def modo_notificacao(email):
+    # A preferência é do usuário dono do e-mail; destinatários sem cadastro usam o padrão da aplicação
+    usuario = User.query.filter(func.lower(User.email) == email.strip().lower()).first()
+    if usuario and usuario.preferencia_notificacao in MODOS_NOTIFICACAO:
+        return usuario.preferencia_notificacao
+    return current_app.config['NOTIFICACAO_MODO_PADRAO']
+
+
+class ConexaoSMTP(Connection):
+    """Conexão do Flask-Mail com limite de tempo no socket: um relay travado não prende o worker."""
+
+    def configure_host(self):
+        timeout = current_app.config['MAIL_TIMEOUT']
+        if self.mail.use_ssl:
+            host = smtplib.SMTP_SSL(self.mail.server, self.mail.port, timeout=timeout)
+        else:
+            host = smtplib.SMTP(self.mail.server, self.mail.port, timeout=timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+
+def conectar_smtp():
+    return ConexaoSMTP(current_app.extensions['mail'])
+
+
+def disjuntor_smtp():
+    # Um disjuntor por processo, compartilhado por todas as threads
+    if 'disjuntor_smtp' not in current_app.extensions:
+        current_app.extensions['disjuntor_smtp'] = Disjuntor(
+            'smtp', current_app.config['SMTP_LIMITE_FALHAS'], current_app.config['SMTP_TEMPO_ABERTO_SEGUNDOS'])
+    return current_app.extensions['disjuntor_smtp']
+
+
+def enviar_email(to_email, subject, body):
+    """Retorna False se o e-mail não foi enviado, inclusive sem tentar quando o relay SMTP vem falhando."""
+    disjuntor = disjuntor_smtp()
+    if not disjuntor.permite():
+        print(f"SMTP indisponível (disjuntor aberto); e-mail para {to_email} não enviado.")
+        return False
+    try:
+        msg = Message(subject,
+                      sender=current_app.config['MAIL_USERNAME'],
+                      recipients=[to_email])
+        msg.body = body
+        with conectar_smtp() as conexao:
+            conexao.send(msg)
+        disjuntor.registrar_sucesso()
+        print(f"E-mail enviado com sucesso para {to_email}.")
+        return True
+    except (smtplib.SMTPException, OSError) as e:
+        disjuntor.registrar_falha()
+        print(f"Erro ao enviar e-mail: {e}")
+        return False
+    except Exception as e:
+        # Erro da mensagem (ex.: BadHeaderError), não do relay: só libera a chamada de teste do disjuntor
+        disjuntor.liberar_teste()
+        print(f"Erro ao enviar e-mail: {e}")
+        return False
+
+
+def notificar_novo_convenio(convenio):
+    """Envia o aviso de novo convênio na hora ou o deixa na fila do resumo, conforme a preferência do diretor.
+
+    No modo resumo, ou se o envio falhar, a notificação é apenas adicionada à sessão; quem chama faz o commit.
+    """
+    destinatario = convenio.diretor_responsavel_email
+    if not destinatario:
+        return
+
+    if modo_notificacao(destinatario) == 'resumo':
+        db.session.add(NotificacaoPendente(destinatario=destinatario, tipo='NOVO_CONVENIO', convenio_id=convenio.id))
+        return
+
+    # Quebras de linha no nome gerariam um cabeçalho inválido (BadHeaderError)
+    assunto = f"Nova Parceria Cadastrada - {' '.join(convenio.nome_conveniada.split())}"
+    corpo = f"""Prezado(a) Diretor(a),\n\n
+Informamos que a unidade {convenio.unidade_uniesp} firmou nova parceria com a empresa {convenio.nome_conveniada},
+com benefícios educacionais válidos a partir de {convenio.data_assinatura.strftime('%d/%m/%Y')}.
+
+Termo anexado: [https://uniespvestibular.com.br/convenios/]
+
+
+Atenciosamente,
+Equipe UNIESP"""
+    if not enviar_email(destinatario, assunto, corpo):
+        # Relay fora do ar: o aviso não se perde, sai no próximo resumo
+        db.session.add(NotificacaoPendente(destinatario=destinatario, tipo='NOVO_CONVENIO', convenio_id=convenio.id))
+
+
+def enfileirar_vencimentos(hoje=None):
+    # Gera um aviso de vencimento (uma única vez por convênio) para os convênios ativos que vencem
+    # dentro da antecedência configurada. Sem CONVENIO_VIGENCIA_DIAS não há como calcular o vencimento.
+    vigencia = current_app.config.get('CONVENIO_VIGENCIA_DIAS')
+    if not vigencia:
+        return 0
+    hoje = hoje or date.today()
+    antecedencia = current_app.config['NOTIFICACAO_ANTECEDENCIA_VENCIMENTO_DIAS']
+    inicio = hoje - timedelta(days=vigencia)
+    fim = inicio + timedelta(days=antecedencia)
+
+    ja_avisados = db.session.query(NotificacaoPendente.convenio_id).filter(
+        NotificacaoPendente.tipo == 'VENCIMENTO', NotificacaoPendente.convenio_id.isnot(None))
+    convenios = db.session.query(Convenios.id, Convenios.diretor_responsavel_email).filter(
+        Convenios.status == ConvenioStatus.ativo,
+        Convenios.diretor_responsavel_email.isnot(None),
+        Convenios.data_assinatura.between(inicio, fim),
+        Convenios.id.notin_(ja_avisados)
+    ).all()
+    for convenio_id, destinatario in convenios:
+        db.session.add(NotificacaoPendente(destinatario=destinatario, tipo='VENCIMENTO', convenio_id=convenio_id))
+    db.session.commit()
+    return len(convenios)
+
+
+def enviar_resumos():
+    """Envia um único e-mail por destinatário com todas as notificações pendentes, usando uma só sessão SMTP."""
+    enfileirar_vencimentos()
+    vigencia = current_app.config.get('CONVENIO_VIGENCIA_DIAS')
+    destinatarios = [d for (d,) in db.session.query(NotificacaoPendente.destinatario)
+                     .filter(NotificacaoPendente.enviado_em.is_(None)).distinct()]
+    if not destinatarios:
+        return 0
+
+    disjuntor = disjuntor_smtp()
+    if not disjuntor.permite():
+        # As notificações continuam pendentes para a próxima execução
+        print("SMTP indisponível (disjuntor aberto); resumos adiados.")
+        return 0
+
+    enviados = 0
+    try:
+        with conectar_smtp() as conexao:
+            for destinatario in destinatarios:
+                pendentes = db.session.query(NotificacaoPendente, Convenios) \
+                    .outerjoin(Convenios, Convenios.id == NotificacaoPendente.convenio_id) \
+                    .filter(NotificacaoPendente.destinatario == destinatario, NotificacaoPendente.enviado_em.is_(None)) \
+                    .order_by(NotificacaoPendente.id).all()
+
+                # Convênios excluídos depois do aviso não entram no resumo
+                novos = [c for n, c in pendentes if c is not None and n.tipo == 'NOVO_CONVENIO']
+                vencendo = [(c, c.data_assinatura + timedelta(days=vigencia)) for n, c in pendentes
+                            if c is not None and n.tipo == 'VENCIMENTO' and vigencia]
+                if novos or vencendo:
+                    msg = Message(f"Resumo de Convênios - {date.today().strftime('%d/%m/%Y')}",
+                                  sender=current_app.config['MAIL_USERNAME'],
+                                  recipients=[destinatario])
+                    msg.body = render_template('email/resumo_diretor.txt', novos=novos, vencendo=vencendo)
+                    conexao.send(msg)
+                    enviados += 1
+
+                # Confirma por destinatário para que uma falha no meio não reenvie os resumos já entregues
+                for notificacao, _ in pendentes:
+                    notificacao.enviado_em = datetime.now()
+                db.session.commit()
+    except (smtplib.SMTPException, OSError):
+        # Os destinatários já confirmados não são reenviados; os demais ficam para a próxima execução
+        disjuntor.registrar_falha()
+        db.session.rollback()
+        raise
+    except Exception:
+        disjuntor.liberar_teste()
+        db.session.rollback()
+        raise
+    disjuntor.registrar_sucesso()
+    return enviados
+
+
+# --- Comandos de linha (flask notificacoes ...) ---
+notificacoes_cli = AppGroup('notificacoes', help='Envio de notificações por e-mail.')
+
+
+@notificacoes_cli.command('enviar-resumo')
+def enviar_resumo_command():
+    """Envia o resumo de notificações pendentes para cada destinatário."""
+    enviados = enviar_resumos()
+    click.echo(f"{enviados} resumo(s) enviado(s).")
+
+
+class _SMTPFalho(socketserver.BaseRequestHandler):
+    def handle(self):
+        if self.server.modo == 'recusar':
+            self.request.sendall(b'421 Servico temporariamente indisponivel\r\n')
+            return
+        # 'travar': aceita a conexão e nunca responde, até o cliente desistir
+        while self.request.recv(1024):
+            pass
+
+
+@notificacoes_cli.command('smtp-falho')
+@click.option('--modo', type=click.Choice(['travar', 'recusar']), default='travar', show_default=True)
+@click.option('--porta', default=1025, show_default=True)
+def smtp_falho_command(modo, porta):
+    """Sobe um relay SMTP defeituoso em localhost, para exercitar o timeout e o disjuntor.
+
+    Rode a aplicação com FLASK_MAIL_SERVER=localhost FLASK_MAIL_PORT=<porta> FLASK_MAIL_USE_TLS=0.
+    """
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(('localhost', porta), _SMTPFalho) as servidor:
+        servidor.daemon_threads = True
+        servidor.modo = modo
+        click.echo(f"SMTP defeituoso ({modo}) em localhost:{porta}. Ctrl+C para parar.")
+        servidor.serve_forever()
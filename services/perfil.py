@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+from flask_login import current_user
+from sqlalchemy import event
+
+from services.consultas import RAIZ_PROJETO
+
+
+def _nome_frame(frame):
+    codigo = frame.f_code
+    arquivo = codigo.co_filename
+    if arquivo.startswith(RAIZ_PROJETO):
+        arquivo = os.path.relpath(arquivo, RAIZ_PROJETO)
+    else:
+        arquivo = os.path.basename(arquivo)
+    return f"{codigo.co_name} ({arquivo}:{codigo.co_firstlineno})"
+
+
+class PerfilRequisicao:
+    """Perfil estatístico de uma requisição: amostra a pilha da thread em intervalos fixos
+    e cronometra as instruções SQL executadas por ela."""
+
+    def __init__(self, engine, intervalo):
+        self.engine = engine
+        self.intervalo = intervalo
+        self.thread_id = threading.get_ident()
+        self.pilhas = Counter()
+        self.sql = []
+        self._parar = threading.Event()
+        self._inicio_sql = None
+        self._amostrador = threading.Thread(target=self._amostrar, name='perfil-amostrador', daemon=True)
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+        event.listen(self.engine, 'before_cursor_execute', self._antes_sql)
+        event.listen(self.engine, 'after_cursor_execute', self._depois_sql)
+        self._amostrador.start()
+
+    def parar(self):
+        self.duracao = time.perf_counter() - self.inicio
+        self._parar.set()
+        self._amostrador.join()
+        event.remove(self.engine, 'before_cursor_execute', self._antes_sql)
+        event.remove(self.engine, 'after_cursor_execute', self._depois_sql)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                pilha.append(_nome_frame(frame))
+                frame = frame.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def _antes_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            self._inicio_sql = time.perf_counter()
+
+    def _depois_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id and self._inicio_sql is not None:
+            self.sql.append({'ms': round((time.perf_counter() - self._inicio_sql) * 1000, 3), 'sql': statement})
+            self._inicio_sql = None
+
+    def salvar(self, diretorio, nome, metadados):
+        # <nome>.folded: formato "pilha;recolhida contagem", aceito por flamegraph.pl, speedscope e afins
+        os.makedirs(diretorio, exist_ok=True)
+        with open(os.path.join(diretorio, nome + '.folded'), 'w') as arquivo:
+            for pilha, amostras in self.pilhas.items():
+                arquivo.write(f"{pilha} {amostras}\n")
+        metadados = dict(metadados,
+                         duracao_ms=round(self.duracao * 1000, 3),
+                         intervalo_ms=self.intervalo * 1000,
+                         amostras=sum(self.pilhas.values()),
+                         sql_total_ms=round(sum(s['ms'] for s in self.sql), 3),
+                         sql=self.sql)
+        with open(os.path.join(diretorio, nome + '.json'), 'w') as arquivo:
+            json.dump(metadados, arquivo, ensure_ascii=False, indent=2)
+
+
+def listar_perfis(diretorio):
+    if not os.path.isdir(diretorio):
+        return []
+    perfis = []
+    with os.scandir(diretorio) as entradas:
+        for entrada in entradas:
+            if entrada.name.endswith('.json'):
+                with open(entrada.path) as arquivo:
+                    metadados = json.load(arquivo)
+                metadados.pop('sql', None)
+                perfis.append(dict(metadados, nome=entrada.name[:-len('.json')]))
+    return sorted(perfis, key=lambda p: p['inicio'], reverse=True)
+
+
+def _limpar_antigos(diretorio, maximo):
+    perfis = listar_perfis(diretorio)
+    for perfil in perfis[maximo:]:
+        for extensao in ('.folded', '.json'):
+            try:
+                os.remove(os.path.join(diretorio, perfil['nome'] + extensao))
+            except FileNotFoundError:
+                pass
+
+
+def _deve_perfilar():
+    # Pedido explícito (cabeçalho X-Perfil: 1 ou ?_perfil=1) vale só para administradores
+    if request.headers.get('X-Perfil') == '1' or request.args.get('_perfil') == '1':
+        return current_user.is_authenticated and current_user.role == 'admin'
+    # A amostragem só cobre usuários logados: requisições anônimas não gravam nada em disco
+    amostragem = current_app.config['PERFIL_AMOSTRAGEM']
+    return amostragem > 0 and current_user.is_authenticated and random.random() < amostragem
+
+
+def _iniciar_perfil():
+    if not _deve_perfilar():
+        return
+    from db import db
+    g.perfil = PerfilRequisicao(db.engine, current_app.config['PERFIL_INTERVALO_MS'] / 1000)
+    g.perfil_inicio = datetime.now()
+    g.perfil.iniciar()
+
+
+def _encerrar_perfil(exc):
+    perfil = g.pop('perfil', None)
+    if perfil is None:
+        return
+    perfil.parar()
+    inicio = g.pop('perfil_inicio')
+    diretorio = current_app.config['PERFIL_DIRETORIO']
+    nome = f"{inicio.strftime('%Y%m%d-%H%M%S-%f')}_{request.method}_{request.endpoint or 'desconhecido'}"
+    perfil.salvar(diretorio, nome, {
+        'inicio': inicio.isoformat(),
+        'metodo': request.method,
+        'caminho': request.full_path,
+        'endpoint': request.endpoint,
+        'erro': repr(exc) if exc else None
+    })
+    _limpar_antigos(diretorio, current_app.config['PERFIL_MAXIMO_ARQUIVOS'])
+
+
+def init_app(app):
+    app.before_request(_iniciar_perfil)
+    app.teardown_request(_encerrar_perfil)
@@ -0,0 +1,263 @@
+import re
+import sys
+import uuid
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_login import login_user, logout_user
+from sqlalchemy import func, insert, select, text
+
+from db import db
+from routes.routes_convenio import resolver_diretor_id
+from services.auditoria import preencher_resumo
+from services.cnpj import PESOS_PRIMEIRO_DV, PESOS_SEGUNDO_DV, _digito_verificador
+from services.consultas import ContadorConsultas
+from services.relatorios import versao_dados
+from models.convenios import AuditLog, ConvenioDuplicata, Convenios, ConvenioRemovido, ConvenioStatus, NotificacaoPendente, Relatorio, User
+
+# Custo máximo (unidades do planejador) aceito para as consultas pontuais
+ORCAMENTO_CUSTO_PADRAO = 500
+
+# Só instruções que o EXPLAIN aceita (BEGIN, SAVEPOINT etc. ficam de fora)
+_RE_EXPLICAVEL = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\s', re.IGNORECASE)
+
+
+class Verificacao:
+    """Executa 'executar' e passa pelo EXPLAIN cada instrução SQL que ele emitir.
+
+    'seq_scan_em' lista as tabelas que podem (e devem) ser lidas por inteiro: listagens completas e tabelas
+    pequenas por natureza. Nas demais, o Seq Scan só é aceito se o planejador o escolheu por a tabela ser
+    pequena; com enable_seqscan desligado ele precisa encontrar um índice.
+    """
+
+    def __init__(self, nome, executar, seq_scan_em=(), orcamento=ORCAMENTO_CUSTO_PADRAO, status=(200,)):
+        self.nome = nome
+        self.executar = executar
+        self.seq_scan_em = set(seq_scan_em)
+        self.orcamento = orcamento
+        # Status HTTP esperados quando 'executar' despacha uma rota (qualquer outro indica que ela não rodou por inteiro)
+        self.status = status
+
+
+def requisicao(url, usuario, metodo='GET', dados=None):
+    """Despacha uma requisição dentro do contexto de aplicação atual.
+
+    O contexto de aplicação é reaproveitado, então a rota usa a mesma sessão (e a mesma transação) da
+    massa semeada. Só servem rotas que não fazem commit.
+    """
+    def executar():
+        app = current_app._get_current_object()
+        with app.test_request_context(url, method=metodo, data=dados):
+            if usuario is None:
+                logout_user()
+            else:
+                login_user(usuario)
+            return app.full_dispatch_request()
+    return executar
+
+
+def verificacoes(amostra):
+    diretor, admin, convenio = amostra['diretor'], amostra['admin'], amostra['convenio']
+    ontem = (date.today() - timedelta(days=1)).isoformat()
+    return [
+        # Rotas despachadas de verdade: o SQL verificado é o que elas emitem
+        Verificacao('login', requisicao('/login', None, 'POST', {'email': diretor.email.upper(), 'password': 'x'}),
+                    status=(302,)),
+        Verificacao('get_users_api', requisicao('/users_api', admin), seq_scan_em={'users'}, orcamento=None),
+        Verificacao('get_diretores_api', requisicao('/users/diretores_api', admin), seq_scan_em={'users'}, orcamento=None),
+        Verificacao('get_convenios_api (admin)', requisicao('/convenios_api', admin), seq_scan_em={'convenio'}, orcamento=None),
+        Verificacao('get_convenios_api (diretor)', requisicao('/convenios_api', diretor)),
+        Verificacao('get_convenios_changes', requisicao(f"/convenios/changes?since={amostra['cursor']}", diretor)),
+        Verificacao('get_convenio', requisicao(f'/convenio/{convenio.id}', diretor)),
+        Verificacao('get_convenios_by_cnpj', requisicao(f'/convenios/by-cnpj/{convenio.cnpj_normalizado}', diretor)),
+        Verificacao('get_convenios_duplicatas', requisicao('/convenios/duplicatas', admin),
+                    seq_scan_em={'convenio_duplicata'}, orcamento=None),
+        # Sem o arquivo no storage local a rota responde 404, mas a consulta de escopo já foi feita
+        Verificacao('download_file', requisicao(f'/uploads/{convenio.caminho_arquivo_pdf}', diretor), status=(200, 302, 404)),
+        Verificacao('get_logs_auditoria', requisicao('/logs_auditoria', admin), seq_scan_em={'audit_log', 'users'}, orcamento=None),
+        # O resumo é pequeno por natureza (uma linha por dia, usuário, ação e tabela): vale o limite de custo
+        Verificacao('get_logs_auditoria_analitico', requisicao('/logs_auditoria/analitico', admin),
+                    seq_scan_em={'audit_log_resumo', 'users'}),
+        Verificacao('get_logs_auditoria_registros',
+                    requisicao(f'/logs_auditoria/registros?inicio={ontem}&user_id={diretor.id}', admin)),
+        Verificacao('get_relatorios_api', requisicao('/relatorios_api', admin)),
+        Verificacao('get_relatorio', requisicao(f"/relatorios/{amostra['relatorio_id']}", admin)),
+
+        # Consultas de rotas que gravam e do worker, que não podem ser despachadas aqui sem commit:
+        # ao alterar uma delas, atualize a cópia abaixo
+        Verificacao('register / update_user_api (e-mail existente)', User.query.filter(
+            func.lower(User.email) == diretor.email.lower(), User.id != admin.id).limit(1).all),
+        Verificacao('resolver_diretor_id', lambda: resolver_diretor_id(diretor.username.upper(), diretor.email.upper())),
+        Verificacao('versao_dados (convenios)', lambda: versao_dados('convenios')),
+        Verificacao('versao_dados (auditoria)', lambda: versao_dados('auditoria')),
+        Verificacao('solicitar_relatorio (cache)', Relatorio.query.filter(Relatorio.chave_cache == 'planos').limit(1).all),
+        Verificacao('reservar_proximo (fila de relatórios)', Relatorio.query.filter(
+            Relatorio.status == 'pendente').order_by(Relatorio.id).limit(1).all),
+        Verificacao('enviar_resumos (pendentes do destinatário)', db.session.query(NotificacaoPendente, Convenios)
+                    .outerjoin(Convenios, Convenios.id == NotificacaoPendente.convenio_id)
+                    .filter(NotificacaoPendente.destinatario == diretor.email, NotificacaoPendente.enviado_em.is_(None))
+                    .order_by(NotificacaoPendente.id).all),
+    ]
+
+
+def _cnpj_sintetico(i):
+    # CNPJ com dígitos verificadores válidos, aceito por normalizar_cnpj
+    base = f'{i + 1:012d}'
+    base += _digito_verificador(base, PESOS_PRIMEIRO_DV)
+    return base + _digito_verificador(base, PESOS_SEGUNDO_DV)
+
+
+def semear(qtd_convenios):
+    """Insere uma massa sintética (dentro da transação corrente) e retorna uma amostra para as consultas."""
+    sufixo = uuid.uuid4().hex[:8]
+    qtd_unidades = max(qtd_convenios // 100, 1)
+    # Proporção parecida com a de produção (poucos convênios por diretor): users precisa ter páginas
+    # suficientes para que as buscas pontuais usem os índices
+    qtd_diretores = max(qtd_convenios // 5, 1)
+
+    ids_diretores = db.session.execute(insert(User).returning(User.id), [{
+        'username': f'planos_{sufixo}_{i}',
+        'email': f'planos_{sufixo}_{i}@exemplo.com',
+        'role': 'diretor',
+        'unidade_uniesp': f'Unidade {i % qtd_unidades}'
+    } for i in range(qtd_diretores)]).scalars().all()
+    admin = User(username=f'planos_{sufixo}_admin', email=f'planos_{sufixo}_admin@exemplo.com', role='admin')
+    db.session.add(admin)
+
+    hoje = date.today()
+    # Versões acima das já existentes, espalhadas como em produção: o cursor recente deve alcançar poucas linhas
+    versao_base = db.session.execute(select(func.txid_current())).scalar()
+    convenios = [{
+        'id': uuid.uuid4(),
+        'nome_conveniada': f'Empresa {i}',
+        'cnpj': _cnpj_sintetico(i),
+        'cnpj_normalizado': _cnpj_sintetico(i),
+        'nome_fantasia': f'Fantasia {i}',
+        'cidade': f'Cidade {i % 300}',
+        'estado': 'PB',
+        'area_atuacao': 'Serviços',
+        'qtd_funcionarios': 10,
+        'qtd_associados': 0,
+        'qtd_sindicalizados': 0,
+        'responsavel_legal': 'Responsável',
+        'cargo_responsavel': 'Diretor',
+        'email_responsavel': f'contato{i}@exemplo.com',
+        'telefone_responsavel': '83999999999',
+        'unidade_uniesp': f'Unidade {i % qtd_unidades}',
+        'diretor_responsavel': f'planos_{sufixo}_{i % qtd_diretores}',
+        'diretor_responsavel_email': f'planos_{sufixo}_{i % qtd_diretores}@exemplo.com',
+        'diretor_id': ids_diretores[i % qtd_diretores],
+        'data_assinatura': hoje - timedelta(days=i % 1500),
+        'caminho_arquivo_pdf': f'{uuid.uuid4()}_termo.pdf',
+        'status': list(ConvenioStatus)[i % len(ConvenioStatus)],
+        'versao': versao_base + i,
+    } for i in range(qtd_convenios)]
+    db.session.execute(insert(Convenios), convenios)
+    db.session.execute(insert(ConvenioRemovido), [
+        {'convenio_id': uuid.uuid4(), 'versao': versao_base + i} for i in range(0, qtd_convenios, 10)])
+    db.session.execute(insert(AuditLog), [{
+        'user_id': ids_diretores[i % qtd_diretores],
+        'action': 'UPDATE',
+        'record_id': str(convenios[i % qtd_convenios]['id']),
+        'table_name': 'convenio',
+        'details': 'Carga sintética'
+    } for i in range(qtd_convenios * 4)])
+    pares = [sorted((convenios[i]['id'], convenios[i + 1]['id'])) for i in range(0, qtd_convenios - 1, 2)]
+    db.session.execute(insert(ConvenioDuplicata), [
+        {'convenio_a': a, 'convenio_b': b, 'pontuacao': 0.9, 'criterio': 'nome', 'grupo': a} for a, b in pares])
+
+    db.session.execute(insert(NotificacaoPendente), [{
+        'destinatario': f'planos_{sufixo}_{i % qtd_diretores}@exemplo.com',
+        'tipo': 'NOVO_CONVENIO',
+        'convenio_id': convenios[i]['id'],
+        # A maior parte já enviada, como em produção: o índice parcial cobre só as pendentes
+        'enviado_em': None if i % 20 == 0 else hoje,
+    } for i in range(qtd_convenios)])
+
+    preencher_resumo()
+    db.session.execute(insert(Relatorio), [{
+        'tipo': 'convenios',
+        'formato': 'csv',
+        'parametros': {'unidade_uniesp': f'Unidade {i % qtd_unidades}'},
+        'chave_cache': uuid.uuid4().hex,
+        'txid_solicitacao': versao_base,
+        'cacheavel': True,
+        'status': 'concluido'
+    } for i in range(max(qtd_convenios // 10, 1))])
+
+    # Estatísticas atualizadas para o planejador enxergar a massa semeada
+    for tabela in ('users', 'convenio', 'convenio_removido', 'audit_log', 'notificacao_pendente', 'convenio_duplicata', 'relatorio', 'audit_log_resumo'):
+        db.session.execute(text(f'ANALYZE {tabela}'))
+
+    db.session.flush()
+    return {
+        'diretor': db.session.get(User, ids_diretores[0]),
+        'admin': admin,
+        'convenio': db.session.get(Convenios, convenios[-1]['id']),
+        'cursor': versao_base + qtd_convenios - 10,
+        'relatorio_id': db.session.query(func.max(Relatorio.id)).scalar(),
+    }
+
+
+def _nos(plano):
+    yield plano
+    for filho in plano.get('Plans', []):
+        yield from _nos(filho)
+
+
+def _tabelas_seq_scan(conexao, instrucao, parametros):
+    plano = conexao.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + instrucao, parametros).scalar()[0]['Plan']
+    return plano, {no.get('Relation Name') for no in _nos(plano) if no['Node Type'] == 'Seq Scan'}
+
+
+def verificar_planos(qtd_convenios):
+    """Executa as verificações e passa pelo EXPLAIN o SQL emitido; retorna a lista de (nome, problema)."""
+    problemas = []
+    try:
+        amostra = semear(qtd_convenios)
+        for verificacao in verificacoes(amostra):
+            with ContadorConsultas(db.engine, guardar_sql=True) as contador:
+                resultado = verificacao.executar()
+            status = getattr(resultado, 'status_code', None)
+            if status is not None and status not in verificacao.status:
+                problemas.append((verificacao.nome, f"status {status} (esperado {', '.join(map(str, verificacao.status))})"))
+
+            conexao = db.session.connection()
+            for instrucao, parametros in contador.execucoes:
+                if not _RE_EXPLICAVEL.match(instrucao):
+                    continue
+                plano, tabelas = _tabelas_seq_scan(conexao, instrucao, parametros)
+                proibidas = tabelas - verificacao.seq_scan_em
+                if proibidas:
+                    # Em tabela pequena o Seq Scan é o plano mais barato; sem ele o planejador precisa achar um índice
+                    conexao.exec_driver_sql('SET LOCAL enable_seqscan = off')
+                    proibidas = _tabelas_seq_scan(conexao, instrucao, parametros)[1] - verificacao.seq_scan_em
+                    conexao.exec_driver_sql('SET LOCAL enable_seqscan = on')
+                resumo = ' '.join(instrucao.split())[:120]
+                if proibidas:
+                    problemas.append((verificacao.nome, f"Seq Scan em {', '.join(sorted(proibidas))} sem índice utilizável: {resumo}"))
+                if verificacao.orcamento is not None and plano['Total Cost'] > verificacao.orcamento:
+                    problemas.append((verificacao.nome, f"custo {plano['Total Cost']} acima do orçamento "
+                                                        f"{verificacao.orcamento}: {resumo}"))
+                click.echo(f"{verificacao.nome}: {plano['Node Type']}, custo {plano['Total Cost']}")
+    finally:
+        # A massa sintética nunca é gravada
+        db.session.rollback()
+    return problemas
+
+
+# --- Comandos de linha (flask planos ...) ---
+planos_cli = AppGroup('planos', help='Verificação dos planos de execução das consultas.')
+
+
+@planos_cli.command('verificar')
+@click.option('--convenios', 'qtd_convenios', default=5000, show_default=True,
+              help='Quantidade de convênios sintéticos semeados antes do EXPLAIN.')
+def verificar_command(qtd_convenios):
+    """Falha (código 1) se alguma consulta das rotas usar Seq Scan sem índice ou passar do orçamento de custo."""
+    problemas = verificar_planos(qtd_convenios)
+    for nome, problema in problemas:
+        click.echo(f"FALHA {nome}: {problema}", err=True)
+    sys.exit(1 if problemas else 0)
@@ -0,0 +1,313 @@
+import csv
+import hashlib
+import io
+import json
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from enum import Enum
+from importlib.util import find_spec
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, func, or_, select, text
+
+from db import db
+from models.convenios import AuditLog, ConvenioRemovido, Convenios, ConvenioStatus, Relatorio, User
+from services.storage import obter_storage
+from services.uploads import em_lotes
+
+TIPOS = ('convenios', 'auditoria')
+FORMATOS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+}
+# Dependências opcionais de cada formato (o CSV só usa a biblioteca padrão)
+DEPENDENCIAS = {'xlsx': 'openpyxl', 'pdf': 'reportlab'}
+
+# Colunas de cada tipo de relatório: (cabeçalho, coluna consultada)
+COLUNAS = {
+    'convenios': [
+        ('Conveniada', Convenios.nome_conveniada),
+        ('Nome fantasia', Convenios.nome_fantasia),
+        ('CNPJ', Convenios.cnpj),
+        ('Cidade', Convenios.cidade),
+        ('Estado', Convenios.estado),
+        ('Unidade', Convenios.unidade_uniesp),
+        ('Diretor', Convenios.diretor_responsavel),
+        ('Assinatura', Convenios.data_assinatura),
+        ('Status', Convenios.status),
+    ],
+    'auditoria': [
+        ('Data/Hora', AuditLog.timestamp),
+        ('Usuário', User.username),
+        ('Ação', AuditLog.action),
+        ('Tabela', AuditLog.table_name),
+        ('Registro', AuditLog.record_id),
+        ('Detalhes', AuditLog.details),
+    ],
+}
+
+
+def formatos_disponiveis():
+    return [formato for formato in FORMATOS
+            if formato not in DEPENDENCIAS or find_spec(DEPENDENCIAS[formato]) is not None]
+
+
+def validar_parametros(dados):
+    """Retorna (tipo, formato, parâmetros normalizados) de um pedido. Levanta ValueError."""
+    tipo = dados.get('tipo')
+    formato = dados.get('formato')
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de relatório inválido. Use: {', '.join(TIPOS)}.")
+    if formato not in formatos_disponiveis():
+        raise ValueError(f"Formato indisponível. Use: {', '.join(formatos_disponiveis())}.")
+
+    parametros = {}
+    unidade = (dados.get('unidade_uniesp') or '').strip()
+    if unidade:
+        parametros['unidade_uniesp'] = unidade
+    for campo in ('data_inicio', 'data_fim'):
+        if dados.get(campo):
+            try:
+                parametros[campo] = date.fromisoformat(dados[campo]).isoformat()
+            except ValueError:
+                raise ValueError(f"Data inválida em '{campo}' (use AAAA-MM-DD).")
+    if 'data_inicio' in parametros and 'data_fim' in parametros and parametros['data_inicio'] > parametros['data_fim']:
+        raise ValueError('A data inicial é posterior à data final.')
+    if tipo == 'convenios' and dados.get('status'):
+        if dados['status'] not in [s.value for s in ConvenioStatus]:
+            raise ValueError('Status inválido.')
+        parametros['status'] = dados['status']
+    return tipo, formato, parametros
+
+
+def versao_dados(tipo):
+    # Muda a cada gravação que pode alterar o relatório (consultas atendidas pelos índices: max() lê uma linha)
+    if tipo == 'convenios':
+        return db.session.query(func.greatest(
+            db.session.query(func.max(Convenios.versao)).scalar_subquery(),
+            db.session.query(func.max(ConvenioRemovido.versao)).scalar_subquery())).scalar() or 0
+    return db.session.query(func.max(AuditLog.id)).scalar() or 0
+
+
+def calcular_chave_cache(tipo, formato, parametros, versao):
+    conteudo = json.dumps([tipo, formato, parametros, versao], sort_keys=True)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def solicitar_relatorio(tipo, formato, parametros, usuario):
+    """Retorna (relatório, criado). Pedidos idênticos sobre os mesmos dados reaproveitam o existente."""
+    chave_cache = calcular_chave_cache(tipo, formato, parametros, versao_dados(tipo))
+    existente = Relatorio.query.filter(
+        Relatorio.chave_cache == chave_cache,
+        or_(Relatorio.status.in_(('pendente', 'processando')),
+            and_(Relatorio.status == 'concluido', Relatorio.cacheavel.is_(True)))
+    ).order_by(Relatorio.id.desc()).first()
+    if existente:
+        return existente, False
+
+    # Transações ainda abertas podem gravar linhas com versão menor que a lida acima;
+    # o worker só marca o arquivo como reaproveitável depois que todas elas terminarem
+    txid = db.session.execute(text('SELECT txid_snapshot_xmax(txid_current_snapshot())')).scalar()
+    relatorio = Relatorio(tipo=tipo, formato=formato, parametros=parametros, chave_cache=chave_cache,
+                          txid_solicitacao=txid, solicitado_por=usuario.id)
+    db.session.add(relatorio)
+    db.session.commit()
+    return relatorio, True
+
+
+def consulta_relatorio(tipo, parametros):
+    query = select(*[coluna for _, coluna in COLUNAS[tipo]])
+    inicio = date.fromisoformat(parametros['data_inicio']) if 'data_inicio' in parametros else None
+    fim = date.fromisoformat(parametros['data_fim']) if 'data_fim' in parametros else None
+
+    if tipo == 'convenios':
+        if 'unidade_uniesp' in parametros:
+            query = query.where(Convenios.unidade_uniesp == parametros['unidade_uniesp'])
+        if inicio:
+            query = query.where(Convenios.data_assinatura >= inicio)
+        if fim:
+            query = query.where(Convenios.data_assinatura <= fim)
+        if 'status' in parametros:
+            query = query.where(Convenios.status == ConvenioStatus(parametros['status']))
+        return query.order_by(Convenios.unidade_uniesp, Convenios.data_assinatura, Convenios.id)
+
+    # Auditoria: a unidade é a do usuário que executou a ação
+    query = query.join(User, AuditLog.user_id == User.id)
+    if 'unidade_uniesp' in parametros:
+        query = query.where(User.unidade_uniesp == parametros['unidade_uniesp'])
+    if inicio:
+        query = query.where(AuditLog.timestamp >= inicio)
+    if fim:
+        query = query.where(AuditLog.timestamp < fim + timedelta(days=1))
+    return query.order_by(AuditLog.timestamp, AuditLog.id)
+
+
+def titulo_relatorio(relatorio):
+    filtros = ', '.join(f"{campo}: {valor}" for campo, valor in sorted(relatorio.parametros.items()))
+    return f"Relatório de {relatorio.tipo}" + (f" ({filtros})" if filtros else '')
+
+
+def _valor_celula(valor):
+    if isinstance(valor, Enum):
+        return valor.value
+    if isinstance(valor, datetime) and valor.tzinfo is not None:
+        # Planilhas não aceitam fuso horário: converte para o horário local
+        return valor.astimezone().replace(tzinfo=None)
+    return valor
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    return str(valor)
+
+
+def escrever_csv(arquivo, titulo, cabecalho, linhas):
+    # Ponto e vírgula e BOM: abre direto no Excel em português
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    escritor = csv.writer(texto, delimiter=';')
+    escritor.writerow(cabecalho)
+    for linha in linhas:
+        escritor.writerow([_texto(valor) for valor in linha])
+    texto.flush()
+    texto.detach()
+
+
+def escrever_xlsx(arquivo, titulo, cabecalho, linhas):
+    from openpyxl import Workbook
+
+    # write_only grava as linhas em fluxo, sem manter a planilha inteira em memória
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet('Relatório')
+    planilha.append([titulo])
+    planilha.append(cabecalho)
+    for linha in linhas:
+        planilha.append(linha)
+    livro.save(arquivo)
+
+
+def escrever_pdf(arquivo, titulo, cabecalho, linhas):
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    largura, altura = landscape(A4)
+    margem = 36
+    altura_linha = 11
+    largura_coluna = (largura - 2 * margem) / len(cabecalho)
+    # Caracteres que cabem em uma coluna com fonte de 7pt
+    limite = int(largura_coluna / 3.6)
+    pdf = canvas.Canvas(arquivo, pagesize=(largura, altura))
+
+    def nova_pagina():
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawString(margem, altura - margem, titulo)
+        y = altura - margem - 24
+        pdf.setFont('Helvetica-Bold', 7)
+        for i, nome in enumerate(cabecalho):
+            pdf.drawString(margem + i * largura_coluna, y, nome)
+        pdf.setFont('Helvetica', 7)
+        return y - altura_linha
+
+    y = nova_pagina()
+    for linha in linhas:
+        if y < margem:
+            pdf.showPage()
+            y = nova_pagina()
+        for i, valor in enumerate(linha):
+            pdf.drawString(margem + i * largura_coluna, y, _texto(valor)[:limite])
+        y -= altura_linha
+    pdf.save()
+
+
+ESCRITORES = {'csv': escrever_csv, 'xlsx': escrever_xlsx, 'pdf': escrever_pdf}
+
+
+def reservar_proximo(tempo_maximo_minutos):
+    """Reserva o próximo pedido da fila. Vários workers podem rodar ao mesmo tempo (SKIP LOCKED)."""
+    # Pedidos 'processando' há tempo demais são de um worker que morreu e voltam para a fila
+    abandonado = datetime.now() - timedelta(minutes=tempo_maximo_minutos)
+    relatorio = Relatorio.query.filter(or_(
+        Relatorio.status == 'pendente',
+        and_(Relatorio.status == 'processando', Relatorio.iniciado_em < abandonado)
+    )).order_by(Relatorio.id).with_for_update(skip_locked=True).first()
+    if relatorio is None:
+        db.session.rollback()
+        return None
+    relatorio.status = 'processando'
+    relatorio.iniciado_em = datetime.now()
+    db.session.commit()
+    return relatorio
+
+
+def processar(relatorio):
+    try:
+        xmin = db.session.execute(text('SELECT txid_snapshot_xmin(txid_current_snapshot())')).scalar()
+        cabecalho = [nome for nome, _ in COLUNAS[relatorio.tipo]]
+        consulta = consulta_relatorio(relatorio.tipo, relatorio.parametros)
+        # yield_per: as linhas chegam do banco em lotes (cursor no servidor), sem carregar o resultado inteiro
+        linhas = ([_valor_celula(valor) for valor in linha]
+                  for linha in db.session.execute(consulta.execution_options(yield_per=1000)))
+        chave = f"relatorio_{relatorio.id}_{relatorio.chave_cache[:16]}.{relatorio.formato}"
+        with tempfile.TemporaryFile() as arquivo:
+            ESCRITORES[relatorio.formato](arquivo, titulo_relatorio(relatorio), cabecalho, linhas)
+            arquivo.seek(0)
+            obter_storage().salvar(chave, arquivo, FORMATOS[relatorio.formato])
+
+        relatorio.chave_arquivo = chave
+        relatorio.status = 'concluido'
+        relatorio.cacheavel = xmin >= relatorio.txid_solicitacao
+        relatorio.concluido_em = datetime.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        relatorio.status = 'erro'
+        relatorio.erro = str(e)
+        relatorio.concluido_em = datetime.now()
+        db.session.commit()
+
+
+# --- Comandos de linha (flask relatorios ...) ---
+relatorios_cli = AppGroup('relatorios', help='Geração dos relatórios em segundo plano.')
+
+
+@relatorios_cli.command('worker')
+@click.option('--intervalo', default=5, show_default=True, help='Segundos de espera quando a fila está vazia.')
+@click.option('--uma-vez', is_flag=True, help='Processa os pedidos pendentes e sai (para agendar via cron).')
+def worker_command(intervalo, uma_vez):
+    """Gera os relatórios pedidos em /relatorios. Nunca rode a geração dentro dos workers web."""
+    tempo_maximo = current_app.config['RELATORIO_TEMPO_MAXIMO_MINUTOS']
+    while True:
+        relatorio = reservar_proximo(tempo_maximo)
+        if relatorio is None:
+            if uma_vez:
+                return
+            time.sleep(intervalo)
+            continue
+        click.echo(f"Gerando relatório {relatorio.id} ({relatorio.tipo}, {relatorio.formato})...")
+        processar(relatorio)
+        click.echo(f"Relatório {relatorio.id}: {relatorio.status}" + (f" ({relatorio.erro})" if relatorio.erro else ''))
+
+
+@relatorios_cli.command('limpar')
+@click.option('--dias', default=30, show_default=True, help='Remove os relatórios pedidos há mais dias que isto.')
+def limpar_command(dias):
+    """Apaga os relatórios antigos e seus arquivos."""
+    limite = datetime.now() - timedelta(days=dias)
+    antigos = db.session.query(Relatorio.id, Relatorio.chave_arquivo) \
+        .filter(Relatorio.criado_em < limite, Relatorio.status.in_(('concluido', 'erro'))).all()
+    storage = obter_storage()
+    for lote in em_lotes(antigos, 1000):
+        for _, chave in lote:
+            if chave:
+                storage.remover(chave)
+        Relatorio.query.filter(Relatorio.id.in_([relatorio_id for relatorio_id, _ in lote])).delete(synchronize_session=False)
+        db.session.commit()
+    click.echo(f"{len(antigos)} relatório(s) removido(s).")
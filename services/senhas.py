@@ -0,0 +1,127 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeoutError
+from concurrent.futures import wait
+from functools import lru_cache
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from db import db
+from models.convenios import User
+
+
+class VerificacaoSaturada(Exception):
+    """Há verificações de senha demais na fila: o login deve responder 503 em vez de esperar."""
+
+
+@lru_cache(maxsize=None)
+def _parametros_efetivos(metodo):
+    # 'scrypt' vira 'scrypt:32768:8:1', 'pbkdf2' vira 'pbkdf2:sha256:<iterações>' etc.: é o prefixo gravado no hash
+    return generate_password_hash('', method=metodo).split('$', 1)[0]
+
+
+def precisa_rehash(password_hash):
+    """Indica se o hash foi gerado com parâmetros diferentes de PASSWORD_HASH_METHOD."""
+    return password_hash.split('$', 1)[0] != _parametros_efetivos(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+class VerificadorSenhas:
+    """Executa o cálculo dos hashes de senha em um pool próprio e limitado de threads.
+
+    O custo do hash (scrypt/pbkdf2 liberam o GIL) fica restrito a 'threads' execuções simultâneas;
+    com mais de 'fila_maxima' pedidos esperando, o pedido é recusado na hora (VerificacaoSaturada)
+    em vez de ocupar mais workers web durante um pico de logins.
+    """
+
+    def __init__(self, threads, fila_maxima, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='verificador-senhas')
+        self._vagas = threading.BoundedSemaphore(threads + fila_maxima)
+
+    def executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            raise VerificacaoSaturada()
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        # A vaga só é liberada quando o cálculo termina, mesmo que quem pediu tenha desistido por timeout
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeoutError:
+            raise VerificacaoSaturada()
+
+    def verificar(self, password_hash, senha):
+        return self.executar(check_password_hash, password_hash, senha)
+
+    def gerar_hash(self, senha):
+        return self.executar(generate_password_hash, senha, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def obter_verificador():
+    return current_app.extensions['verificador_senhas']
+
+
+def init_app(app):
+    app.extensions['verificador_senhas'] = VerificadorSenhas(
+        app.config['LOGIN_THREADS'], app.config['LOGIN_FILA_MAXIMA'], app.config['LOGIN_TIMEOUT_SEGUNDOS'])
+
+
+# --- Comandos de linha (flask usuarios ...) ---
+usuarios_cli = AppGroup('usuarios', help='Manutenção dos usuários.')
+
+
+@usuarios_cli.command('benchmark-login')
+@click.option('--requisicoes', default=200, show_default=True, help='Total de logins.')
+@click.option('--concorrencia', default=16, show_default=True, help='Logins simultâneos.')
+def benchmark_login_command(requisicoes, concorrencia):
+    """Mede a vazão de POST /login com um usuário temporário (criado e removido pelo comando)."""
+    app = current_app._get_current_object()
+    senha = uuid.uuid4().hex
+    usuario = User(username=f'benchmark_{uuid.uuid4().hex[:8]}', role='diretor')
+    usuario.email = f'{usuario.username}@exemplo.com'
+    usuario.set_password(senha)
+    db.session.add(usuario)
+    db.session.commit()
+
+    inicio = time.perf_counter()
+    check_password_hash(usuario.password_hash, senha)
+    click.echo(f"Método: {app.config['PASSWORD_HASH_METHOD']} "
+               f"({(time.perf_counter() - inicio) * 1000:.1f} ms por verificação isolada)")
+
+    def logar(_):
+        # Cliente novo a cada login: sem sessão, cada requisição percorre o caminho completo
+        comeco = time.perf_counter()
+        with app.test_client() as cliente:
+            # Identificador em maiúsculas: exercita a busca por lower()
+            resposta = cliente.post('/login', data={'email': usuario.email.upper(), 'password': senha})
+        # Login aceito redireciona para os convênios; recusado volta para /login
+        aceito = resposta.status_code == 302 and not resposta.headers.get('Location', '').endswith('/login')
+        return resposta.status_code, aceito, time.perf_counter() - comeco
+
+    try:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            futuros = [executor.submit(logar, i) for i in range(requisicoes)]
+            wait(futuros)
+        duracao = time.perf_counter() - inicio
+        resultados = [futuro.result() for futuro in futuros]
+    finally:
+        db.session.delete(usuario)
+        db.session.commit()
+
+    latencias = sorted(tempo for _, aceito, tempo in resultados if aceito)
+    recusados = sum(1 for status, _, _ in resultados if status == 503)
+    click.echo(f"{requisicoes} logins em {duracao:.2f} s: {requisicoes / duracao:.1f} logins/s "
+               f"({len(latencias)} aceitos, {recusados} recusados com 503, "
+               f"{requisicoes - len(latencias) - recusados} com outro status)")
+    if latencias:
+        p95 = latencias[max(int(len(latencias) * 0.95) - 1, 0)]
+        click.echo(f"Latência: mediana {statistics.median(latencias) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
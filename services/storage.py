@@ -0,0 +1,159 @@
+import os
+import re
+import shutil
+import uuid
+
+from flask import current_app, url_for
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.utils import secure_filename
+
+# Chaves geradas pela aplicação: <uuid4>_<nome seguro>.pdf
+PADRAO_CHAVE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_[\w.-]+\.pdf$', re.IGNORECASE)
+
+
+def gerar_chave(nome_arquivo):
+    return str(uuid.uuid4()) + "_" + secure_filename(nome_arquivo)
+
+
+def chave_valida(chave):
+    return bool(chave) and PADRAO_CHAVE.match(chave) is not None
+
+
+def _serializer_chaves():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='chave-upload')
+
+
+def assinar_chave(chave, user_id):
+    # Entregue junto com a URL pré-assinada: o formulário devolve a assinatura, não a chave
+    return _serializer_chaves().dumps({'chave': chave, 'user_id': user_id})
+
+
+def chave_assinada(assinatura, user_id):
+    """Chave gerada pelo presign para este usuário, ou None se a assinatura for inválida, expirada ou de outro usuário."""
+    try:
+        dados = _serializer_chaves().loads(assinatura, max_age=current_app.config['STORAGE_URL_EXPIRACAO'])
+    except (BadSignature, SignatureExpired):
+        return None
+    if dados.get('user_id') != user_id or not chave_valida(dados.get('chave')):
+        return None
+    return dados['chave']
+
+
+class LocalStorage:
+    """Armazena os arquivos em um diretório local (UPLOAD_FOLDER)."""
+
+    # os.scandir não garante ordem; em compensação existe() é só um stat
+    listagem_ordenada = False
+
+    def __init__(self, pasta, segredo, expiracao):
+        self.pasta = pasta
+        self.expiracao = expiracao
+        self._serializer = URLSafeTimedSerializer(segredo, salt='upload-direto')
+        os.makedirs(pasta, exist_ok=True)
+
+    def caminho(self, chave):
+        return os.path.join(self.pasta, chave)
+
+    def salvar(self, chave, arquivo, tipo_conteudo='application/pdf'):
+        with open(self.caminho(chave), 'wb') as destino:
+            shutil.copyfileobj(arquivo, destino)
+
+    def remover(self, chave):
+        try:
+            os.remove(self.caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def existe(self, chave):
+        return os.path.isfile(self.caminho(chave))
+
+    def listar(self):
+        # Percorre o diretório como fluxo, sem carregar a listagem inteira em memória
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if entrada.is_file():
+                    yield entrada.name, entrada.stat().st_mtime
+
+    def url_download(self, chave):
+        # O backend local não tem URL externa: o arquivo é servido pela própria aplicação
+        return None
+
+    def url_upload(self, chave):
+        # Equivalente local do upload pré-assinado: um token de curta duração para a rota de upload direto
+        return {
+            'url': url_for('convenio_bp.upload_direto'),
+            'fields': {'token': self._serializer.dumps(chave)}
+        }
+
+    def validar_token(self, token):
+        try:
+            return self._serializer.loads(token, max_age=self.expiracao)
+        except (BadSignature, SignatureExpired):
+            return None
+
+
+class S3Storage:
+    """Armazena os arquivos em um bucket compatível com S3 (AWS, MinIO...)."""
+
+    # list_objects_v2 devolve as chaves em ordem binária (UTF-8); existe() custa uma requisição HEAD
+    listagem_ordenada = True
+
+    def __init__(self, bucket, expiracao, tamanho_maximo, endpoint_url=None, regiao=None):
+        # Dependência opcional: só é necessária quando STORAGE_BACKEND='s3'
+        import boto3
+
+        self.bucket = bucket
+        self.expiracao = expiracao
+        self.tamanho_maximo = tamanho_maximo
+        self._client = boto3.client('s3', endpoint_url=endpoint_url, region_name=regiao)
+
+    def salvar(self, chave, arquivo, tipo_conteudo='application/pdf'):
+        self._client.upload_fileobj(arquivo, self.bucket, chave, ExtraArgs={'ContentType': tipo_conteudo})
+
+    def remover(self, chave):
+        self._client.delete_object(Bucket=self.bucket, Key=chave)
+
+    def existe(self, chave):
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=chave)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def listar(self):
+        paginador = self._client.get_paginator('list_objects_v2')
+        for pagina in paginador.paginate(Bucket=self.bucket):
+            for objeto in pagina.get('Contents', []):
+                yield objeto['Key'], objeto['LastModified'].timestamp()
+
+    def url_download(self, chave):
+        return self._client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': chave,
+            'ResponseContentDisposition': f'attachment; filename="{chave}"'
+        }, ExpiresIn=self.expiracao)
+
+    def url_upload(self, chave):
+        return self._client.generate_presigned_post(
+            self.bucket, chave,
+            Fields={'Content-Type': 'application/pdf'},
+            Conditions=[{'Content-Type': 'application/pdf'}, ['content-length-range', 1, self.tamanho_maximo]],
+            ExpiresIn=self.expiracao)
+
+
+def init_app(app):
+    if app.config['STORAGE_BACKEND'] == 's3':
+        storage = S3Storage(app.config['S3_BUCKET'], app.config['STORAGE_URL_EXPIRACAO'],
+                            app.config['MAX_CONTENT_LENGTH'],
+                            endpoint_url=app.config['S3_ENDPOINT_URL'], regiao=app.config['S3_REGION'])
+    else:
+        storage = LocalStorage(app.config['UPLOAD_FOLDER'], app.config['SECRET_KEY'],
+                               app.config['STORAGE_URL_EXPIRACAO'])
+    app.extensions['storage'] = storage
+
+
+def obter_storage():
+    return current_app.extensions['storage']
@@ -0,0 +1,122 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+from sqlalchemy import collate, select
+
+from db import db
+from models.convenios import Convenios
+from services.storage import chave_valida, obter_storage
+
+
+def em_lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def chaves_referenciadas(chaves):
+    # Consulta por conjunto (IN) atendida pelo índice de caminho_arquivo_pdf
+    return {chave for (chave,) in db.session.query(Convenios.caminho_arquivo_pdf)
+            .filter(Convenios.caminho_arquivo_pdf.in_(chaves))}
+
+
+def encontrar_orfaos(storage, carencia_segundos, tamanho_lote):
+    """Percorre o storage como fluxo e gera as chaves sem convênio associado.
+
+    Arquivos mais novos que a carência são ignorados: podem ser uploads diretos cujo formulário
+    ainda não foi enviado. Arquivos que não seguem o padrão de chave da aplicação nunca são tocados.
+    """
+    limite = time.time() - carencia_segundos
+    for lote in em_lotes(storage.listar(), tamanho_lote):
+        chaves = [chave for chave, modificado_em in lote if modificado_em < limite and chave_valida(chave)]
+        if not chaves:
+            continue
+        referenciadas = chaves_referenciadas(chaves)
+        for chave in chaves:
+            if chave not in referenciadas:
+                yield chave
+
+
+def _referencias_por_id(tamanho_lote):
+    # Lotes pela chave primária (keyset), sem acumular os lotes anteriores na sessão
+    ultimo_id = None
+    while True:
+        query = db.session.query(Convenios.id, Convenios.caminho_arquivo_pdf) \
+            .filter(Convenios.caminho_arquivo_pdf.isnot(None))
+        if ultimo_id is not None:
+            query = query.filter(Convenios.id > ultimo_id)
+        lote = query.order_by(Convenios.id).limit(tamanho_lote).all()
+        if not lote:
+            return
+        yield from lote
+        ultimo_id = lote[-1][0]
+        db.session.expunge_all()
+
+
+def _referencias_por_chave(tamanho_lote):
+    # Mesma ordem da listagem do S3 (binária, COLLATE "C"), lida por cursor no servidor em lotes
+    chave = collate(Convenios.caminho_arquivo_pdf, 'C')
+    consulta = select(Convenios.id, Convenios.caminho_arquivo_pdf) \
+        .where(Convenios.caminho_arquivo_pdf.isnot(None)) \
+        .order_by(chave, Convenios.id) \
+        .execution_options(stream_results=True, yield_per=tamanho_lote)
+    yield from db.session.execute(consulta)
+
+
+def encontrar_referencias_quebradas(storage, tamanho_lote):
+    """Gera (id, chave) dos convênios que apontam para arquivos inexistentes, com memória limitada ao lote.
+
+    Com listagem ordenada (S3), as chaves do banco e do storage são percorridas juntas em ordem (merge),
+    sem uma requisição por linha; no storage local cada linha custa só um stat.
+    """
+    if not storage.listagem_ordenada:
+        for convenio_id, chave in _referencias_por_id(tamanho_lote):
+            if not storage.existe(chave):
+                yield convenio_id, chave
+        return
+
+    armazenadas = (chave for chave, _ in storage.listar())
+    atual = next(armazenadas, None)
+    for convenio_id, chave in _referencias_por_chave(tamanho_lote):
+        while atual is not None and atual < chave:
+            atual = next(armazenadas, None)
+        # Só o que não apareceu na listagem é confirmado no storage: pode ter sido enviado depois dela
+        if atual != chave and not storage.existe(chave):
+            yield convenio_id, chave
+
+
+# --- Comandos de linha (flask uploads ...) ---
+uploads_cli = AppGroup('uploads', help='Manutenção dos arquivos enviados.')
+
+
+@uploads_cli.command('gc')
+@click.option('--apagar', is_flag=True, help='Apaga os arquivos órfãos (sem esta opção apenas lista).')
+@click.option('--carencia-horas', default=24, show_default=True, help='Idade mínima de um arquivo para ser considerado órfão.')
+@click.option('--lote', 'tamanho_lote', default=1000, show_default=True, help='Quantidade de chaves por consulta ao banco.')
+def gc_command(apagar, carencia_horas, tamanho_lote):
+    """Reconcilia o storage com o banco: arquivos órfãos e convênios apontando para arquivos ausentes."""
+    storage = obter_storage()
+
+    orfaos = 0
+    for chave in encontrar_orfaos(storage, carencia_horas * 3600, tamanho_lote):
+        orfaos += 1
+        if apagar:
+            storage.remover(chave)
+            click.echo(f"apagado: {chave}")
+        else:
+            click.echo(f"órfão: {chave}")
+
+    quebradas = 0
+    for convenio_id, chave in encontrar_referencias_quebradas(storage, tamanho_lote):
+        quebradas += 1
+        click.echo(f"arquivo ausente: convênio {convenio_id} -> {chave}")
+
+    acao = 'apagado(s)' if apagar else 'encontrado(s)'
+    click.echo(f"{orfaos} arquivo(s) órfão(s) {acao}; {quebradas} convênio(s) com arquivo ausente.")
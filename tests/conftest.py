@@ -0,0 +1,123 @@
+import uuid
+from datetime import date
+
+import pytest
+
+
+# Os testes usam o banco de DATABASE_URL, já migrado (flask db upgrade)
+@pytest.fixture
+def app():
+    pytest.importorskip('flask_sqlalchemy')
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app import app as aplicacao
+    from db import db
+
+    aplicacao.config['TESTING'] = True
+    with aplicacao.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except OperationalError:
+            pytest.skip('PostgreSQL indisponível (configure DATABASE_URL).')
+        yield aplicacao
+        db.session.rollback()
+
+
+@pytest.fixture
+def criar_usuario(app):
+    """Cria usuários confirmados no banco; tudo o que eles gravaram na auditoria é removido ao final."""
+    from db import db
+    from models.convenios import AuditLog, AuditLogResumo, User
+
+    criados = []
+
+    def criar(role='diretor', unidade_uniesp=None):
+        usuario = User(username=f'teste_{uuid.uuid4().hex[:8]}', role=role, unidade_uniesp=unidade_uniesp)
+        usuario.email = f'{usuario.username}@exemplo.com'
+        usuario.set_password(uuid.uuid4().hex)
+        db.session.add(usuario)
+        db.session.commit()
+        criados.append(usuario.id)
+        return usuario
+
+    yield criar
+    db.session.rollback()
+    for user_id in criados:
+        AuditLogResumo.query.filter_by(user_id=user_id).delete()
+        AuditLog.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+    db.session.commit()
+
+
+@pytest.fixture
+def criar_convenio(app):
+    """Cria convênios confirmados no banco; eles e seus tombstones são removidos ao final."""
+    from db import db
+    from models.convenios import Convenios, ConvenioRemovido, ConvenioStatus
+
+    criados = []
+
+    def criar(**campos):
+        dados = dict(
+            nome_conveniada='Conveniada Teste', cnpj='12.345.678/0001-95', nome_fantasia='Teste',
+            cidade='João Pessoa', estado='PB', area_atuacao='Comércio',
+            qtd_funcionarios=1, qtd_associados=1, qtd_sindicalizados=1,
+            responsavel_legal='Responsável', cargo_responsavel='Diretor', email_responsavel='resp@exemplo.com',
+            telefone_responsavel='83999999999', unidade_uniesp=f'Unidade {uuid.uuid4().hex[:8]}',
+            diretor_responsavel='Diretor', data_assinatura=date.today(), status=ConvenioStatus.ativo)
+        dados.update(campos)
+        convenio = Convenios(**dados)
+        db.session.add(convenio)
+        db.session.commit()
+        criados.append(convenio.id)
+        return convenio
+
+    yield criar
+    db.session.rollback()
+    for convenio_id in criados:
+        Convenios.query.filter_by(id=convenio_id).delete()
+        ConvenioRemovido.query.filter_by(convenio_id=convenio_id).delete()
+    db.session.commit()
+
+
+@pytest.fixture
+def logar(app):
+    """Devolve um cliente de teste já autenticado como o usuário informado."""
+    def cliente_de(usuario):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sessao:
+            sessao['_user_id'] = str(usuario.id)
+            sessao['_fresh'] = True
+        return cliente
+    return cliente_de
+
+
+@pytest.fixture
+def admin(criar_usuario):
+    return criar_usuario('admin')
+
+
+@pytest.fixture
+def cliente_admin(logar, admin):
+    return logar(admin)
+
+
+@pytest.fixture
+def verificar_orcamento(app):
+    """Executa a requisição contando o SQL (ContadorConsultas) e falha se ela passar do orçamento declarado
+    na rota com @orcamento_consultas ou repetir a mesma consulta (possível N+1).
+
+        resposta = verificar_orcamento(cliente_admin, 'GET', '/convenios_api')
+    """
+    from db import db
+    from services.consultas import ContadorConsultas
+
+    def verificar(cliente, metodo, url, **kwargs):
+        endpoint, _ = app.url_map.bind('localhost').match(url.split('?', 1)[0], method=metodo)
+        orcamento = getattr(app.view_functions[endpoint], 'orcamento_consultas', None)
+        assert orcamento is not None, f'{endpoint} não declara @orcamento_consultas'
+        with ContadorConsultas(db.engine) as contador:
+            resposta = cliente.open(url, method=metodo, **kwargs)
+        contador.verificar(orcamento)
+        return resposta
+    return verificar
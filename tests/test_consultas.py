@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from db import db
+from models.convenios import Convenios
+from services.consultas import ContadorConsultas, impressao_digital
+
+
+def test_impressao_digital_ignora_valores():
+    assert impressao_digital('SELECT * FROM convenio WHERE id = 10') == \
+        impressao_digital('SELECT * FROM convenio WHERE id = 20')
+
+
+def test_contador_detecta_n_mais_1(app, criar_convenio):
+    ids = [criar_convenio().id for _ in range(4)]
+    db.session.expire_all()
+
+    with ContadorConsultas(db.engine) as contador:
+        for convenio_id in ids:
+            Convenios.query.filter_by(id=convenio_id).first()
+
+    assert contador.total == 4
+    with pytest.raises(AssertionError, match='possível N\\+1'):
+        contador.verificar()
+
+
+def test_contador_aponta_orcamento_estourado(app):
+    with ContadorConsultas(db.engine) as contador:
+        db.session.execute(db.select(Convenios.id).limit(1)).all()
+        db.session.execute(db.select(Convenios.versao).limit(1)).all()
+
+    with pytest.raises(AssertionError, match='acima do orçamento de 1'):
+        contador.verificar(orcamento=1)
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from db import db
+from models.convenios import AuditLog, Convenios
+
+
+def test_excluir_convenio_registra_auditoria_e_tombstone(cliente_admin, admin, criar_convenio):
+    convenio_id = criar_convenio().id
+    cursor = cliente_admin.get('/convenios/changes').get_json()['cursor']
+
+    resposta = cliente_admin.delete(f'/convenio/{convenio_id}')
+    assert resposta.status_code == 200
+
+    assert db.session.get(Convenios, convenio_id) is None
+    assert AuditLog.query.filter_by(user_id=admin.id, action='DELETE', record_id=str(convenio_id)).count() == 1
+
+    mudancas = cliente_admin.get(f'/convenios/changes?since={cursor}').get_json()
+    assert str(convenio_id) in [removido['id'] for removido in mudancas['removidos']]
+    assert str(convenio_id) not in [convenio['id'] for convenio in mudancas['convenios']]
+
+
+def test_changes_do_diretor_respeita_o_escopo(cliente_admin, criar_usuario, criar_convenio, logar):
+    diretor = criar_usuario('diretor', unidade_uniesp='Unidade do Diretor')
+    cliente_diretor = logar(diretor)
+    proprio = criar_convenio(diretor_id=diretor.id)
+    de_outra_unidade = criar_convenio()
+    cursor = cliente_diretor.get('/convenios/changes').get_json()['cursor']
+
+    # O convênio do diretor passa para outro responsável e outra unidade; o da outra unidade é excluído
+    assert cliente_admin.patch(f'/convenio/{proprio.id}', json={'unidade_uniesp': 'Outra Unidade',
+                                                               'diretor_responsavel': 'Ninguém'}).status_code == 200
+    assert cliente_admin.delete(f'/convenio/{de_outra_unidade.id}').status_code == 200
+
+    mudancas = cliente_diretor.get(f'/convenios/changes?since={cursor}').get_json()
+    removidos = [removido['id'] for removido in mudancas['removidos']]
+    assert str(proprio.id) in removidos
+    assert str(de_outra_unidade.id) not in removidos
+    assert mudancas['convenios'] == []
+
+
+def test_listagem_do_diretor_dentro_do_orcamento(criar_usuario, criar_convenio, logar, verificar_orcamento):
+    diretor = criar_usuario('diretor', unidade_uniesp='Unidade do Orçamento')
+    for _ in range(5):
+        criar_convenio(diretor_id=diretor.id)
+    cliente = logar(diretor)
+
+    resposta = verificar_orcamento(cliente, 'GET', '/convenios_api')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()) == 5
+
+
+def test_changes_e_detalhe_dentro_do_orcamento(cliente_admin, criar_convenio, verificar_orcamento):
+    convenio = criar_convenio()
+    cursor = cliente_admin.get('/convenios/changes').get_json()['cursor']
+
+    assert verificar_orcamento(cliente_admin, 'GET', f'/convenios/changes?since={cursor}').status_code == 200
+    assert verificar_orcamento(cliente_admin, 'GET', f'/convenio/{convenio.id}').status_code == 200
+    assert verificar_orcamento(cliente_admin, 'GET', '/logs_auditoria').status_code == 200
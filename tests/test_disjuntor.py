@@ -0,0 +1,28 @@
+from services.disjuntor import Disjuntor
+
+
+def _meio_aberto():
+    disjuntor = Disjuntor('teste', limite_falhas=1, tempo_aberto=0)
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == 'meio_aberto'
+    return disjuntor
+
+
+def test_meio_aberto_deixa_passar_uma_unica_chamada_de_teste():
+    disjuntor = _meio_aberto()
+    assert disjuntor.permite()
+    assert not disjuntor.permite()
+
+
+def test_erro_que_nao_e_do_servico_libera_a_chamada_de_teste():
+    disjuntor = _meio_aberto()
+    assert disjuntor.permite()
+    disjuntor.liberar_teste()
+    assert disjuntor.permite()
+
+
+def test_sucesso_na_chamada_de_teste_fecha_o_disjuntor():
+    disjuntor = _meio_aberto()
+    assert disjuntor.permite()
+    disjuntor.registrar_sucesso()
+    assert disjuntor.estado == 'fechado'
@@ -0,0 +1,11 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+
+def test_eventos_acima_do_limite_de_conexoes(app, cliente_admin, verificar_orcamento, monkeypatch):
+    monkeypatch.setitem(app.config, 'EVENTOS_MAXIMO_CONEXOES', 0)
+
+    resposta = verificar_orcamento(cliente_admin, 'GET', '/eventos')
+    assert resposta.status_code == 503
+    assert resposta.headers['Retry-After'] == str(app.config['RETRY_AFTER_SEGUNDOS'])
@@ -0,0 +1,7 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+
+def test_perfis_dentro_do_orcamento(cliente_admin, verificar_orcamento):
+    assert verificar_orcamento(cliente_admin, 'GET', '/perfis_api').status_code == 200
@@ -0,0 +1,10 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from services.planos import verificar_planos
+
+
+# Mesmo critério de 'flask planos verificar', com uma massa menor para caber na suíte
+def test_consultas_das_rotas_usam_indices_e_respeitam_o_custo(app):
+    assert verificar_planos(500) == []
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from db import db
+from models.convenios import Relatorio
+
+
+@pytest.fixture
+def relatorios(app, admin):
+    criados = [Relatorio(tipo='convenios', formato='csv', parametros={}, chave_cache=f'teste-{i}',
+                         txid_solicitacao=0, solicitado_por=admin.id) for i in range(3)]
+    db.session.add_all(criados)
+    db.session.commit()
+    yield criados
+    db.session.rollback()
+    Relatorio.query.filter(Relatorio.id.in_([relatorio.id for relatorio in criados])).delete()
+    db.session.commit()
+
+
+def test_relatorios_dentro_do_orcamento(cliente_admin, relatorios, verificar_orcamento):
+    assert verificar_orcamento(cliente_admin, 'GET', '/relatorios_api').status_code == 200
+    assert verificar_orcamento(cliente_admin, 'GET', f'/relatorios/{relatorios[0].id}').status_code == 200
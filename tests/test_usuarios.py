@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+
+def test_listagem_de_usuarios_dentro_do_orcamento(cliente_admin, criar_usuario, verificar_orcamento):
+    for _ in range(3):
+        criar_usuario('diretor')
+
+    assert verificar_orcamento(cliente_admin, 'GET', '/users_api').status_code == 200
+    assert verificar_orcamento(cliente_admin, 'GET', '/users/diretores_api').status_code == 200
+
+
+def test_login_dentro_do_orcamento(app, criar_usuario, verificar_orcamento):
+    diretor = criar_usuario('diretor')
+
+    resposta = verificar_orcamento(app.test_client(), 'POST', '/login',
+                                   data={'email': diretor.email.upper(), 'password': 'senha-errada'})
+    assert resposta.status_code == 302
+    assert resposta.headers['Location'].endswith('/login')